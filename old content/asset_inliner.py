@@ -0,0 +1,977 @@
+#!/usr/bin/env python3
+"""
+Inliner engine behind inline_assets.py, inline_all_assets.py and
+build_site.py. Every linked stylesheet and external script is replaced by
+its contents; in 'complete' mode every other CSS/JS file under assets/
+that the asset rules allow and whose contents the page does not already
+reference is added before </head> (CSS) and </body> (JS) as well. 'fingerprint' mode instead copies
+linked CSS/JS and the images and fonts the page uses to content-hashed
+files (app.3f9a1c2e.css) next to the page and points the references at
+them, so they can be served with far-future immutable caching.
+
+The page is scanned once to collect edits, each asset file is read once per
+run, and the output is assembled with a single join. Relative references
+the page keeps are rebased when the output is written to another directory.
+
+Stylesheets have their local @imports flattened recursively and every
+relative url() rebased to where the CSS ends up, so inlined CSS neither
+waits on further fetches nor points at the wrong place. Optional stages,
+in order: purging CSS rules no site page can use, minification, embedding
+small images and fonts as data URIs, and critical-CSS extraction.
+"""
+
+import base64
+import hashlib
+import os
+import posixpath
+import re
+import sys
+from html.parser import HTMLParser
+
+import asset_rules
+import css_rules
+import minify_assets
+from asset_manifest import MANIFEST_NAME, load_manifest
+from asset_rules import AssetRules
+from build_cache import BuildCache
+from compress_outputs import compress_files, page_weight, print_compressed, print_page_weight, within_budget
+from css_rules import FOLD_SECTIONS, Document, UsedNames, critical_css, parse_stylesheet
+from minify_assets import minify, print_savings
+
+# Stylesheet links and external scripts that get inlined, in one scan
+CSS_LINK_PATTERN = r'<link[^>]*href=["\']([^"\']*\.css[^"\']*)["\'][^>]*>'
+JS_SCRIPT_PATTERN = r'<script[^>]*src=["\']([^"\']*\.js[^"\']*)["\'][^>]*></script>'
+ASSET_TAG_PATTERN = re.compile(f'{CSS_LINK_PATTERN}|{JS_SCRIPT_PATTERN}')
+
+# Where missing assets are added in 'complete' mode
+HEAD_CLOSE_PATTERN = re.compile(r'</head>')
+BODY_CLOSE_PATTERN = re.compile(r'</body>')
+
+MODES = ('inline', 'complete', 'fingerprint')
+
+# Fingerprint mode: hashed copies go in this directory beside the output page
+FINGERPRINT_DIR = 'static'
+FINGERPRINT_LENGTH = 8
+FINGERPRINT_STEM_LENGTH = 40
+
+# Critical-CSS mode: the full stylesheet is fetched without blocking render
+DEFERRED_STYLESHEET = ('<link rel="preload" href="{href}" as="style" '
+                       'onload="this.onload=null;this.rel=\'stylesheet\'">'
+                       '<noscript><link rel="stylesheet" href="{href}"></noscript>')
+
+# The page's own <style> blocks are purged in place in purge mode
+INLINE_STYLES = '<style> blocks'
+
+# Pages whose markup and scripts decide which CSS rules survive a purge
+PURGE_PAGES = ['index.html', 'book.html', 'bookv2.html', 'book_down.html']
+
+# Data-URI stage: local images and fonts up to this many bytes are embedded
+DATA_URI_LIMIT = 4096
+IMG_TAG_PATTERN = re.compile(r'<img\b[^>]*>', re.IGNORECASE)
+IMG_URL_ATTRIBUTE_PATTERN = re.compile(r'\s(src|data-src)\s*=\s*(["\'])([^"\']*)\2', re.IGNORECASE)
+EXTERNAL_URL_PATTERN = re.compile(r'[a-z][a-z0-9+.-]*:|//', re.IGNORECASE)
+# Mirrored files often lack an extension, so media types come from the contents
+MEDIA_SIGNATURES = [
+    (b'\x89PNG', 'image/png'), (b'\xff\xd8\xff', 'image/jpeg'), (b'GIF8', 'image/gif'),
+    (b'wOF2', 'font/woff2'), (b'wOFF', 'font/woff'), (b'OTTO', 'font/otf'),
+    (b'\x00\x01\x00\x00', 'font/ttf'), (b'\x00\x00\x01\x00', 'image/x-icon'),
+]
+MEDIA_EXTENSIONS = {'.svg': 'image/svg+xml', '.webp': 'image/webp', '.avif': 'image/avif'}
+MEDIA_SUFFIXES = {
+    'image/png': '.png', 'image/jpeg': '.jpg', 'image/gif': '.gif', 'image/x-icon': '.ico',
+    'font/woff2': '.woff2', 'font/woff': '.woff', 'font/otf': '.otf', 'font/ttf': '.ttf',
+    'image/svg+xml': '.svg', 'image/webp': '.webp', 'image/avif': '.avif',
+}
+
+# Asset files indexed for 'complete' mode
+ASSETS_DIR = 'assets'
+INDEXED_EXTENSIONS = ('.css', '.js')
+# Origins of the flat asset_N files an older downloader saved, worked out from
+# their contents, so the asset rules can judge them like any mirrored file.
+# None marks captured API responses that are not page code at all.
+LEGACY_ASSET_URLS = {
+    'asset_0.css': 'https://static.leadpages.net/fonts/font-awesome/6.4.2/css/all.min.css',
+    'asset_1.css': 'https://user.lpcontent.net/fonts/9NnXuxthGCqvt67qHe2ZbV/Mxo7FHokCB2yC7kRgMtruY.css',
+    'asset_62.css': 'https://fonts.googleapis.com/css2?family=DM+Sans',
+    'asset_2.js': 'https://www.googletagmanager.com/gtm.js',
+    'asset_19.js': 'https://niwapproval.io/rt.js',
+    'asset_20.js': 'https://cdn.neverbounce.com/widget/dist/NeverBounce.js',
+    'asset_21.js': 'https://js.center.io/center.js',
+    'asset_22.js': 'https://t.niwapproval.io/v1/lst/universal-script',
+    'asset_23.js': 'https://www.googletagmanager.com/gtag/js',
+    'asset_24.js': 'https://snap.licdn.com/li.lms-analytics/insight.min.js',
+    'asset_25.js': 'https://analytics.tiktok.com/i18n/pixel/events.js',
+    'asset_30.js': None,
+    'asset_31.js': None,
+    'asset_32.js': None,
+    'asset_33.js': None,
+}
+
+# Attributes whose values may point at a local asset
+REFERENCE_ATTRIBUTES = ('href', 'src', 'data-src', 'srcset', 'data-srcset', 'poster', 'data')
+STYLE_URL_PATTERN = re.compile(r'url\(\s*["\']?([^"\')\s]+)["\']?\s*\)', re.IGNORECASE)
+# @import url(x) / @import "x", then any media, supports() or layer conditions;
+# one scan finds imports and other url()s so flattened text is not rescanned
+IMPORT_PATTERN = (r'@import\s+(?:url\(\s*["\']?(?P<import_url>[^"\')\s]+)["\']?\s*\)'
+                  r'|["\'](?P<import_string>[^"\']+)["\'])\s*(?P<conditions>[^;]*);')
+CSS_REFERENCE_PATTERN = re.compile(rf'{IMPORT_PATTERN}|url\(\s*["\']?(?P<url>[^"\')\s]+)["\']?\s*\)', re.IGNORECASE)
+CHARSET_PATTERN = re.compile(r'^\s*@charset\s+["\'][^"\']*["\']\s*;', re.IGNORECASE)
+
+# The page's tokens: comments, <script>/<style> blocks with their bodies, and
+# other tags. Every page edit goes through these, so markup that only appears
+# inside a comment or a script string is never touched
+PAGE_TOKEN_PATTERN = re.compile(
+    r'<!--.*?-->|<(script|style)\b([^>]*)>(.*?)</\1\s*>|<[a-zA-Z][^>]*>',
+    re.DOTALL | re.IGNORECASE
+)
+PAGE_ATTRIBUTE_PATTERN = re.compile(r'\s([\w:-]+)\s*=\s*(["\'])(.*?)\2', re.DOTALL)
+SRCSET_URL_PATTERN = re.compile(r'(?:^|,)\s*([^\s,]+)')
+NUMBER_PATTERN = re.compile(r'(\d+)')
+
+def read_file_content(file_path):
+    """Read file content and return as string."""
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return f.read()
+    except Exception as e:
+        print(f"Error reading {file_path}: {e}")
+        return ""
+
+def get_asset_path(href):
+    """Convert href to local asset path."""
+    if href.startswith('assets/'):
+        return href
+    elif href.startswith('/assets/'):
+        return href[1:]  # Remove leading slash
+    elif href.startswith('./assets/'):
+        return href[2:]  # Remove leading ./
+    return None
+
+def natural_key(path):
+    """Sort key putting asset_2.js before asset_10.js"""
+    return [int(part) if part.isdigit() else part for part in NUMBER_PATTERN.split(path)]
+
+class LocalReferenceParser(HTMLParser):
+    """Collect the local asset paths a page references from its markup.
+
+    Attribute values (srcset split into candidates) and url() in <style>
+    blocks and style attributes count; comments and script bodies do not.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.paths = set()
+        self._in_style = False
+
+    def add(self, reference):
+        path = get_asset_path(reference.strip())
+        if path:
+            self.paths.add(path.split('#')[0].split('?')[0])
+
+    def handle_starttag(self, tag, attrs):
+        for name, value in attrs:
+            if not value:
+                continue
+            if name in ('srcset', 'data-srcset'):
+                for candidate in value.split(','):
+                    if candidate.strip():
+                        self.add(candidate.split()[0])
+            elif name in REFERENCE_ATTRIBUTES:
+                self.add(value)
+            elif name == 'style':
+                for reference in STYLE_URL_PATTERN.findall(value):
+                    self.add(reference)
+        self._in_style = tag == 'style'
+
+    def handle_data(self, data):
+        if self._in_style:
+            for reference in STYLE_URL_PATTERN.findall(data):
+                self.add(reference)
+
+    def handle_endtag(self, tag):
+        self._in_style = False
+
+def local_references(html_content):
+    """Set of local asset paths referenced by the page"""
+    parser = LocalReferenceParser()
+    parser.feed(html_content)
+    parser.close()
+    return parser.paths
+
+class AssetIndex:
+    """Index of the CSS/JS files under the assets directory, keyed by content.
+
+    Only files whose URL the asset rules allow are indexed, so trackers the
+    downloader refuses (and the page loads through its own snippets) are
+    never added. URLs come from the download manifest, else from the
+    <host>/<path> layout, else for the legacy asset_N names from
+    LEGACY_ASSET_URLS; files with no known origin are skipped.
+
+    Mirrors often hold one file under several names (asset_0.css and
+    leadpages.net/.../all.min.css), so presence is decided by SHA-256 of the
+    contents rather than by file name.
+    """
+
+    def __init__(self, read, root=ASSETS_DIR, manifest=None, rules=None):
+        self.digests = {}
+        self.canonical = {}
+        self.skipped = []
+        rules = rules or AssetRules()
+        for url, path in self.candidates(root, manifest):
+            if url and rules.check_url(url)[0]:
+                self.digests[path] = hashlib.sha256(read(path).encode('utf-8')).hexdigest()
+            else:
+                self.skipped.append(path)
+        for path in sorted(self.digests, key=natural_key):
+            self.canonical.setdefault(self.digests[path], path)
+
+    @staticmethod
+    def candidates(root, manifest=None):
+        """(url or None, path) for each CSS/JS file: manifest entries first, then the rest of the tree"""
+        seen = set()
+        if manifest is not None:
+            for url, entry in sorted(manifest.entries.items()):
+                path = entry.get('path')
+                if entry.get('sha256') and path and path.endswith(INDEXED_EXTENSIONS) and os.path.isfile(path):
+                    seen.add(path)
+                    yield url, path
+        for directory, subdirectories, files in os.walk(root):
+            # Skip the content store and other hidden bookkeeping
+            subdirectories[:] = [name for name in subdirectories if not name.startswith('.')]
+            for name in files:
+                path = os.path.join(directory, name).replace(os.sep, '/')
+                if not name.endswith(INDEXED_EXTENSIONS) or path in seen:
+                    continue
+                parts = posixpath.relpath(path, root).split('/')
+                if len(parts) > 1:
+                    yield f"https://{parts[0]}/{'/'.join(parts[1:])}", path
+                else:
+                    yield LEGACY_ASSET_URLS.get(name), path
+
+    def paths(self):
+        return sorted(self.digests, key=natural_key)
+
+    def missing(self, present_paths):
+        """Canonical paths of indexed contents none of present_paths holds, in natural order"""
+        present = {self.digests.get(path) for path in present_paths}
+        return sorted((path for digest, path in self.canonical.items() if digest not in present),
+                      key=natural_key)
+
+def resolve_local(url, base_dir=''):
+    """Local file a relative or root-relative URL points at, or None"""
+    url = url.strip().split('#')[0].split('?')[0]
+    if not url or EXTERNAL_URL_PATTERN.match(url):
+        return None
+    path = posixpath.normpath(url[1:] if url.startswith('/') else posixpath.join(base_dir, url))
+    if path.startswith('..') or not os.path.isfile(path):
+        return None
+    return path
+
+def rebase_url(url, base_dir, target_dir):
+    """url, relative to base_dir, made relative to target_dir; absolute, root and data URLs are unchanged"""
+    url = url.strip()
+    if not url or url.startswith(('#', '/')) or EXTERNAL_URL_PATTERN.match(url):
+        return url
+    path, suffix = re.match(r'([^?#]*)(.*)', url).groups()
+    if not path:
+        return url
+    return posixpath.relpath(posixpath.normpath(posixpath.join(base_dir, path)), target_dir or '.') + suffix
+
+def attribute_references(tag, offset):
+    """(start, end, url) of the URLs in one tag's attributes"""
+    for match in PAGE_ATTRIBUTE_PATTERN.finditer(tag):
+        name = match.group(1).lower()
+        start = offset + match.start(3)
+        if name in ('srcset', 'data-srcset'):
+            for candidate in SRCSET_URL_PATTERN.finditer(match.group(3)):
+                yield start + candidate.start(1), start + candidate.end(1), candidate.group(1)
+        elif name in REFERENCE_ATTRIBUTES or (name == 'content' and get_asset_path(match.group(3))):
+            yield start, offset + match.end(3), match.group(3)
+        elif name == 'style':
+            for url in STYLE_URL_PATTERN.finditer(match.group(3)):
+                yield start + url.start(1), start + url.end(1), url.group(1)
+
+def page_elements(html_content):
+    """PAGE_TOKEN_PATTERN matches for the page's real elements, skipping comments"""
+    for match in PAGE_TOKEN_PATTERN.finditer(html_content):
+        if not match.group().startswith('<!--'):
+            yield match
+
+def asset_tags(html_content):
+    """ASSET_TAG_PATTERN matches for the page's real stylesheet links and external scripts"""
+    for element in page_elements(html_content):
+        match = ASSET_TAG_PATTERN.fullmatch(html_content, element.start(), element.end())
+        if match:
+            yield match
+
+def style_blocks(html_content):
+    """(start, end) of the body of each real <style> block"""
+    for element in page_elements(html_content):
+        if element.group(1) and element.group(1).lower() == 'style':
+            yield element.start(3), element.end(3)
+
+def page_references(html_content):
+    """(start, end, url) of the URLs in the page's tags and <style> blocks"""
+    for match in page_elements(html_content):
+        if match.group(1) is None:
+            yield from attribute_references(match.group(), match.start())
+            continue
+        yield from attribute_references(match.group(2), match.start(2))
+        if match.group(1).lower() == 'style':
+            for url in STYLE_URL_PATTERN.finditer(match.group(3)):
+                yield match.start(3) + url.start(1), match.start(3) + url.end(1), url.group(1)
+
+def rebase_edits(html_content, target_dir, keep=()):
+    """Edits making the page's relative references work from target_dir.
+
+    References starting with one of the keep prefixes are already relative
+    to target_dir (fingerprinted and hoisted files) and stay as they are.
+    """
+    if posixpath.normpath(target_dir or '.') == '.':
+        return []
+    edits = []
+    for start, end, url in page_references(html_content):
+        if keep and url.startswith(keep):
+            continue
+        rebased = rebase_url(url, '', target_dir)
+        if rebased != url.strip():
+            edits.append((start, end, rebased))
+    return edits
+
+def rebase_page(html_content, target_dir, keep=()):
+    """The page with its relative references rebased to target_dir"""
+    parts = []
+    position = 0
+    for start, end, text in rebase_edits(html_content, target_dir, keep):
+        parts.append(html_content[position:start])
+        parts.append(text)
+        position = end
+    parts.append(html_content[position:])
+    return ''.join(parts)
+
+def media_type(path, data):
+    """MIME type of an image or font file, or None for anything else"""
+    for signature, media in MEDIA_SIGNATURES:
+        if data.startswith(signature):
+            return media
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    return MEDIA_EXTENSIONS.get(os.path.splitext(path)[1].lower())
+
+def image_urls(html_content):
+    """(start, end, url) of every <img> src and data-src value"""
+    for element in page_elements(html_content):
+        tag = IMG_TAG_PATTERN.fullmatch(html_content, element.start(), element.end())
+        if not tag:
+            continue
+        for match in IMG_URL_ATTRIBUTE_PATTERN.finditer(tag.group()):
+            yield tag.start() + match.start(3), tag.start() + match.end(3), match.group(3)
+
+def linked_scripts(html_content):
+    """Local script files the page links that exist on disk"""
+    paths = (get_asset_path(match.group(2)) for match in asset_tags(html_content)
+             if match.group(2))
+    return [path for path in paths if path and os.path.exists(path)]
+
+def style_block(css_content):
+    return f'<style type="text/css">\n{css_content}\n</style>'
+
+def script_block(js_content):
+    return f'<script type="text/javascript">\n{js_content}\n</script>'
+
+def add_inliner_arguments(parser):
+    """Add the inliner's optional stages to an argparse parser"""
+    parser.add_argument('--minify', action='store_true', help="Minify CSS and JavaScript as it is inlined")
+    parser.add_argument('--critical', action='store_true',
+                        help="Inline only CSS used above the fold and load full stylesheets asynchronously")
+    parser.add_argument('--fold-sections', type=int, default=FOLD_SECTIONS,
+                        help="Number of top-level page sections counted as above the fold")
+    parser.add_argument('--purge', action='store_true',
+                        help="Drop CSS rules, @font-face and @keyframes that no site page uses")
+    parser.add_argument('--purge-pages', nargs='+', default=PURGE_PAGES,
+                        help="Pages whose elements and scripts count as used when purging")
+    parser.add_argument('--safelist', nargs='+', default=[],
+                        help="Class, id or tag names to keep when purging, e.g. ones scripts build dynamically")
+    parser.add_argument('--data-uris', action='store_true',
+                        help="Embed small images (<img src>, CSS url()) and fonts as base64 data URIs")
+    parser.add_argument('--data-uri-limit', type=int, default=DATA_URI_LIMIT,
+                        help="Largest file in bytes embedded as a data URI")
+    parser.add_argument('--fingerprint-dir', default=FINGERPRINT_DIR,
+                        help="Directory beside the output page for fingerprint mode's hashed files")
+
+def inliner_options(args):
+    """AssetInliner keyword arguments from parsed add_inliner_arguments options"""
+    return {'minify': args.minify, 'critical': args.critical, 'fold_sections': args.fold_sections,
+            'purge': args.purge, 'purge_pages': args.purge_pages, 'safelist': args.safelist,
+            'data_uris': args.data_uris, 'data_uri_limit': args.data_uri_limit,
+            'fingerprint_dir': args.fingerprint_dir}
+
+def print_purged(report):
+    """Report unused CSS removed from (file, original bytes, purged bytes) tuples"""
+    if not report:
+        return
+    print("Unused CSS purged:")
+    for path, before, after in report:
+        print(f"  {path}: {before} -> {after} bytes (-{before - after}, {100 * (before - after) / max(before, 1):.1f}%)")
+    before = sum(entry[1] for entry in report)
+    after = sum(entry[2] for entry in report)
+    print(f"  total: {before} -> {after} bytes (-{before - after})")
+
+def print_render_blocking(report):
+    """Report render-blocking CSS bytes from (path, full bytes, critical bytes) tuples"""
+    if not report:
+        return
+    print("Render-blocking CSS (critical mode):")
+    for path, full, critical in report:
+        print(f"  {path}: {full} -> {critical} bytes inline, rest deferred")
+    full = sum(entry[1] for entry in report)
+    critical = sum(entry[2] for entry in report)
+    print(f"  total: {full} -> {critical} bytes ({100 * critical / max(full, 1):.1f}%)")
+
+def print_data_uris(report):
+    """Report the request/byte trade-off of data URIs from page_data_uris() output"""
+    embedded, external = report
+    if not embedded and not external:
+        return
+    print("Data URIs:")
+    for path, size, uses, added in embedded:
+        print(f"  {path}: {size} bytes embedded {uses}x, +{added} bytes")
+    for path, size in external:
+        print(f"  {path}: {size} bytes, kept external")
+    print(f"  total: {len(embedded)} fewer requests for +{sum(entry[3] for entry in embedded)} bytes; "
+          f"{len(external)} requests ({sum(entry[1] for entry in external)} bytes) left external")
+
+class AssetInliner:
+    """Inline a page's stylesheets and scripts; 'complete' mode also adds unreferenced assets.
+
+    Asset contents (minified when minify is set) are cached for the lifetime
+    of the inliner, so one instance can build several pages that share assets.
+    With critical set, each stylesheet is cut down to the rules matching
+    elements in the first fold_sections sections of the page, and the full
+    file is loaded asynchronously from assets/. With purge set, inlined
+    stylesheets and the page's own <style> blocks lose every rule whose
+    selector names a tag, id, class or attribute that appears neither on
+    the purge_pages (markup, inline and linked scripts) nor in safelist.
+    With data_uris set, local images and fonts of at most data_uri_limit
+    bytes referenced from <img> src/data-src or CSS url() are embedded; in
+    fingerprint mode the rest get hashed copies under fingerprint_dir.
+    """
+
+    def __init__(self, mode='inline', read=read_file_content, minify=False, critical=False,
+                 fold_sections=FOLD_SECTIONS, purge=False, purge_pages=PURGE_PAGES, safelist=(),
+                 data_uris=False, data_uri_limit=DATA_URI_LIMIT, fingerprint_dir=FINGERPRINT_DIR,
+                 assets_dir=ASSETS_DIR, manifest_path=None):
+        if mode not in MODES:
+            raise ValueError(f"Unknown inliner mode: {mode}")
+        self.mode = mode
+        self.minify = minify
+        self.critical = critical
+        self.fold_sections = fold_sections
+        self.purge = purge
+        self.purge_pages = purge_pages
+        self.safelist = safelist
+        self.data_uris = data_uris
+        self.data_uri_limit = data_uri_limit
+        self.fingerprint_dir = fingerprint_dir
+        # Complete mode indexes assets_dir, with origins from its download manifest
+        self.assets_dir = assets_dir
+        self.manifest_path = manifest_path or posixpath.join(assets_dir, MANIFEST_NAME)
+        self._read = read
+        self._contents = {}
+        self._processed = {}
+        self._flattened = {}
+        self._cycles = set()
+        self._rules = {}
+        self._index = None
+        self._used_names = None
+        # path -> (original bytes, minified bytes), and the paths the last page used
+        self.savings = {}
+        self.used = set()
+        # path -> (original bytes, purged bytes); the page's own styles are per page
+        self.purged = {}
+        self._page_purged = None
+        # path -> data URI (None if too large); media referenced per stylesheet and by the page
+        self._data_uris = {}
+        self._media_sizes = {}
+        self._asset_media = {}
+        self._page_media = []
+        # Fingerprint mode: digest -> file name, files written so far, output page directory
+        self._fingerprints = {}
+        self.written = set()
+        self._output_dir = '.'
+        # path -> text inlined into the last page, for page-weight reports
+        self.inlined = {}
+        # (path, full bytes, critical bytes) for the last page in critical mode
+        self.render_blocking = []
+        self._document = None
+
+    def read(self, asset_path):
+        content = self._contents.get(asset_path)
+        if content is None:
+            content = self._contents[asset_path] = self._read(asset_path)
+        return content
+
+    def flatten_css(self, asset_path, stack=()):
+        """Return (imports, css, sources, complete) for a stylesheet with its local @imports inlined.
+
+        url()s come back relative to the site root. imports are the @import
+        rules that stay (remote, missing, or with supports()/layer()
+        conditions), which must precede every other rule. sources are the
+        files read; complete is false when an @import cycle was cut below a
+        nested import, whose result then depends on the path taken to it and
+        is not memoized.
+        """
+        if asset_path in self._flattened:
+            return self._flattened[asset_path]
+        base_dir = posixpath.dirname(asset_path)
+        imports = []
+        sources = {asset_path}
+        complete = True
+
+        def replace(match):
+            nonlocal complete
+            url = match.group('url')
+            if url is not None:
+                return match.group().replace(url, rebase_url(url, base_dir, ''), 1)
+            url = match.group('import_url') or match.group('import_string')
+            conditions = match.group('conditions').strip()
+            path = resolve_local(url, base_dir)
+            kept = f'@import url("{rebase_url(url, base_dir, "")}"){" " + conditions if conditions else ""};'
+            if path is None or conditions.lower().startswith(('supports', 'layer')):
+                imports.append(kept)
+                return ''
+            if path in stack or path == asset_path:
+                if (asset_path, path) not in self._cycles:
+                    self._cycles.add((asset_path, path))
+                    print(f"Warning: @import cycle through {path} in {asset_path}, dropped")
+                complete = False
+                return ''
+            child_imports, css, child_sources, child_complete = self.flatten_css(path, stack + (asset_path,))
+            if child_imports and conditions:
+                # Imports cannot nest inside @media; leave this one to the browser
+                imports.append(kept)
+                return ''
+            imports.extend(child_imports)
+            sources.update(child_sources)
+            complete = complete and child_complete
+            return f"@media {conditions}{{{css}}}" if conditions else css
+
+        css = CSS_REFERENCE_PATTERN.sub(replace, CHARSET_PATTERN.sub('', self.read(asset_path)))
+        result = (imports, css, sources, complete)
+        if complete or not stack:
+            self._flattened[asset_path] = result
+        return result
+
+    def css_sources(self, asset_path):
+        """Every local file a stylesheet pulls in through @import, itself included"""
+        return self.flatten_css(asset_path)[2]
+
+    def asset_text(self, asset_path):
+        """Contents to inline for asset_path: flattened and rebased if CSS, then purged and minified if enabled"""
+        self.used.add(asset_path)
+        content = self._processed.get(asset_path)
+        if content is None:
+            if asset_path.endswith('.css'):
+                imports, css = self.flatten_css(asset_path)[:2]
+                content = ''.join(imports) + css
+            else:
+                content = self.read(asset_path)
+            if self.purge and asset_path.endswith('.css'):
+                purged = self.used_names.purge(parse_stylesheet(content))
+                self.purged[asset_path] = (len(content.encode('utf-8')), len(purged.encode('utf-8')))
+                content = purged
+            if self.minify:
+                minified = minify(asset_path, content)
+                self.savings[asset_path] = (len(content.encode('utf-8')), len(minified.encode('utf-8')))
+                content = minified
+            if asset_path.endswith('.css'):
+                # Inlined CSS lives in the page; a fingerprinted stylesheet sits beside its files
+                media = self._asset_media[asset_path] = []
+                if self.mode == 'fingerprint':
+                    target = posixpath.join(self._output_dir, self.fingerprint_dir)
+                    content = self.embed_css(content, '', media, prefix='', rebase_to=target)
+                else:
+                    content = self.embed_css(content, '', media, rebase_to=self._output_dir)
+            self._processed[asset_path] = content
+        return content
+
+    def page_savings(self):
+        """(path, original bytes, minified bytes) for the assets of the last page inlined"""
+        return [(path,) + self.savings[path] for path in sorted(self.used) if path in self.savings]
+
+    def page_purged(self):
+        """(file, original bytes, purged bytes) for the stylesheets and <style> blocks of the last page"""
+        report = [(path,) + self.purged[path] for path in sorted(self.used) if path in self.purged]
+        if self._page_purged:
+            report.append(self._page_purged)
+        return report
+
+    def data_uri(self, path):
+        """Data URI for a local image or font file, or None if it is too large or not media"""
+        if path not in self._media_sizes:
+            with open(path, 'rb') as f:
+                data = f.read()
+            media = media_type(path, data)
+            self._media_sizes[path] = len(data) if media else None
+            self._data_uris[path] = (f"data:{media};base64,{base64.b64encode(data).decode('ascii')}"
+                                     if media and len(data) <= self.data_uri_limit else None)
+        return self._data_uris[path]
+
+    def embed(self, url, base_dir, media, prefix=None):
+        """Replacement for url if it names a local image or font, else None.
+
+        Small files become data URIs when enabled; in fingerprint mode the
+        rest become prefix plus their hashed file name. Every local media
+        reference is noted in media as (path, bytes added), with None for
+        files left external.
+        """
+        path = resolve_local(url, base_dir)
+        if path is None:
+            return None
+        uri = self.data_uri(path)
+        if self._media_sizes[path] is None:
+            return None
+        if self.data_uris:
+            media.append((path, len(uri) - len(url) if uri else None))
+        else:
+            uri = None
+        if uri is None and self.mode == 'fingerprint':
+            with open(path, 'rb') as f:
+                uri = self.fingerprint_url(path, f.read(), prefix)
+        return uri
+
+    def embed_css(self, css, base_dir, media, prefix=None, rebase_to=None):
+        """css with url()s of local images and fonts, relative to base_dir, embedded or fingerprinted.
+
+        Other relative url()s are rebased to rebase_to when given.
+        """
+        def replace(match):
+            url = match.group(1)
+            uri = self.embed(url, base_dir, media, prefix) if self.data_uris or self.mode == 'fingerprint' else None
+            if uri:
+                return f'url("{uri}")'
+            if rebase_to is not None:
+                return match.group().replace(url, rebase_url(url, base_dir, rebase_to), 1)
+            return match.group()
+        return STYLE_URL_PATTERN.sub(replace, css)
+
+    def image_edits(self, html_content):
+        """Edits embedding or fingerprinting local <img> src and data-src files"""
+        edits = []
+        for start, end, url in image_urls(html_content):
+            uri = self.embed(url, '', self._page_media)
+            if uri:
+                edits.append((start, end, uri))
+        return edits
+
+    def fingerprint_url(self, path, data, prefix=None):
+        """URL of the content-hashed copy of data (the contents of path), writing it if needed.
+
+        prefix defaults to fingerprint_dir, for references from the page itself.
+        """
+        digest = hashlib.sha256(data).hexdigest()[:FINGERPRINT_LENGTH]
+        name = self._fingerprints.get(digest)
+        if name is None:
+            stem, suffix = os.path.splitext(posixpath.basename(path))
+            media = media_type(path, data)
+            if media:
+                suffix = MEDIA_SUFFIXES[media]
+            stem = re.sub(r'[^\w-]+', '-', stem)[:FINGERPRINT_STEM_LENGTH] or 'asset'
+            name = self._fingerprints[digest] = f"{stem}.{digest}{suffix}"
+        target = os.path.join(self._output_dir, self.fingerprint_dir, name)
+        if target not in self.written:
+            if not os.path.exists(target):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with open(target, 'wb') as f:
+                    f.write(data)
+                print(f"Writing fingerprinted {path} -> {target}")
+            self.written.add(target)
+        return name if prefix == '' else posixpath.join(self.fingerprint_dir if prefix is None else prefix, name)
+
+    def page_data_uris(self):
+        """([(path, bytes, uses, bytes added)], [(path, bytes)] kept external) for the last page"""
+        references = list(self._page_media)
+        for path in sorted(self.used):
+            references += self._asset_media.get(path, [])
+        embedded = {}
+        external = {}
+        for path, added in references:
+            if added is None:
+                external[path] = self._media_sizes[path]
+            else:
+                uses, total = embedded.get(path, (0, 0))
+                embedded[path] = (uses + 1, total + added)
+        return ([(path, self._media_sizes[path]) + embedded[path] for path in sorted(embedded)],
+                sorted(external.items()))
+
+    def media_dependencies(self, html_content, assets):
+        """Local images and fonts the page's markup and stylesheets reference"""
+        references = [(url, '') for start, end, url in image_urls(html_content)]
+        references += [(url, '') for url in STYLE_URL_PATTERN.findall(html_content)]
+        for asset_path in assets:
+            if asset_path.endswith('.css') and os.path.exists(asset_path):
+                references += [(url, '') for url in STYLE_URL_PATTERN.findall(self.flatten_css(asset_path)[1])]
+        return sorted({path for path in (resolve_local(url, base_dir) for url, base_dir in references) if path})
+
+    def purge_sources(self):
+        """The purge pages that exist, and the local scripts they link"""
+        pages = [page for page in self.purge_pages if os.path.exists(page)]
+        scripts = [path for page in pages for path in linked_scripts(self.read(page))]
+        return pages, scripts
+
+    @property
+    def used_names(self):
+        """Names used across the purge pages, collected on first use"""
+        if self._used_names is None:
+            self._used_names = UsedNames(self.safelist)
+            pages, scripts = self.purge_sources()
+            for page in self.purge_pages:
+                if page not in pages:
+                    print(f"Warning: purge page not found: {page}")
+            for page in pages:
+                self._used_names.add_document(Document(self.read(page)))
+            if self.mode == 'complete':
+                scripts += [path for path in self.index.paths() if path.endswith('.js')]
+            for path in scripts:
+                self._used_names.add_script(self.read(path))
+        return self._used_names
+
+    def use_page(self, document, scripts):
+        """Count a page being inlined as used, dropping purged CSS that it invalidates"""
+        changed = self.used_names.add_document(document)
+        for path in scripts:
+            changed = self.used_names.add_script(self.read(path)) or changed
+        if changed:
+            self._processed = {path: text for path, text in self._processed.items() if not path.endswith('.css')}
+            self._rules = {}
+
+    def style_edits(self, html_content):
+        """Edits purging the page's own <style> blocks and embedding their small media"""
+        edits = []
+        before = after = 0
+        for start, end in style_blocks(html_content):
+            css = original = html_content[start:end]
+            if self.purge:
+                purged = self.used_names.purge(parse_stylesheet(css))
+                before += len(css.encode('utf-8'))
+                after += len(purged.encode('utf-8'))
+                css = purged
+            css = self.embed_css(css, '', self._page_media, rebase_to=self._output_dir)
+            if css != original:
+                edits.append((start, end, css))
+        self._page_purged = (INLINE_STYLES, before, after) if self.purge and before else None
+        return edits
+
+    def css_block(self, asset_path, href=None):
+        """Markup replacing a stylesheet: all of it, or its critical rules plus a deferred link to href"""
+        content = self.asset_text(asset_path)
+        if not self.critical:
+            self.inlined[asset_path] = content
+            return style_block(content)
+        rules = self._rules.get(asset_path)
+        if rules is None:
+            rules = self._rules[asset_path] = parse_stylesheet(content)
+        critical = critical_css(rules, self._document)
+        if href:
+            # url()s are relative to the fingerprinted stylesheet, not the page
+            stylesheet_dir = posixpath.join(self._output_dir, self.fingerprint_dir)
+            critical = STYLE_URL_PATTERN.sub(
+                lambda match: match.group().replace(
+                    match.group(1), rebase_url(match.group(1), stylesheet_dir, self._output_dir), 1), critical)
+        self.render_blocking.append((asset_path, len(content.encode('utf-8')), len(critical.encode('utf-8'))))
+        self.inlined[asset_path] = critical
+        href = href or rebase_url(asset_path, '', self._output_dir)
+        return (style_block(critical) if critical else '') + DEFERRED_STYLESHEET.format(href=href)
+
+    def js_block(self, asset_path):
+        content = self.inlined[asset_path] = self.asset_text(asset_path)
+        return script_block(content)
+
+    def page_parts(self):
+        """(label, text) for everything inlined into the last page: assets and page-level data URIs"""
+        parts = sorted(self.inlined.items())
+        embedded = {path for path, added in self._page_media if added is not None}
+        parts += [(path, self._data_uris[path]) for path in sorted(embedded)]
+        return parts
+
+    def page_files(self):
+        """Files the last page loads separately: deferred stylesheets and, run-wide, fingerprinted copies"""
+        return sorted({entry[0] for entry in self.render_blocking} | self.written)
+
+    @property
+    def index(self):
+        """The assets_dir index, built on first use"""
+        if self._index is None:
+            manifest = load_manifest(self.assets_dir, self.manifest_path)
+            self._index = AssetIndex(self.read, self.assets_dir, manifest)
+            if self._index.skipped:
+                print(f"Not adding {len(self._index.skipped)} CSS/JS files under {self.assets_dir}/ that the asset "
+                      f"rules deny or that have no known origin")
+        return self._index
+
+    def referenced_assets(self, html_content):
+        """List the local files that inlining this page would read."""
+        references = [match.group(1) or match.group(2) for match in asset_tags(html_content)]
+        assets = [path for path in map(get_asset_path, references) if path]
+        if self.mode == 'complete':
+            assets += self.index.paths() + [self.manifest_path]
+        assets += sorted({source for path in assets if path.endswith('.css') and os.path.exists(path)
+                          for source in self.css_sources(path)} - set(assets))
+        if self.purge:
+            pages, scripts = self.purge_sources()
+            assets += pages + scripts
+        if self.data_uris or self.mode == 'fingerprint':
+            assets += self.media_dependencies(html_content, assets)
+        return assets
+
+    def linked_edits(self, html_content, inlined):
+        """Edits replacing each linked stylesheet/script that exists locally"""
+        edits = []
+        for match in asset_tags(html_content):
+            is_css = match.group(1) is not None
+            href = match.group(1) if is_css else match.group(2)
+            asset_path = get_asset_path(href)
+            kind = 'CSS' if is_css else 'JavaScript'
+            if href.startswith(self.fingerprint_dir + '/'):
+                # Already a cacheable file of its own (fingerprinted or hoisted)
+                continue
+            if not (asset_path and os.path.exists(asset_path)):
+                print(f"Warning: {kind} file not found: {href}")
+                continue
+            inlined.add(asset_path)
+            if is_css:
+                # Stylesheets it imports are part of it now
+                inlined.update(self.css_sources(asset_path))
+            if self.mode == 'fingerprint':
+                url = self.fingerprint_url(asset_path, self.asset_text(asset_path).encode('utf-8'))
+                print(f"Fingerprinting {kind}: {asset_path} -> {url}")
+                if is_css and self.critical:
+                    edits.append((match.start(), match.end(), self.css_block(asset_path, url)))
+                else:
+                    group = 1 if is_css else 2
+                    edits.append((match.start(group), match.end(group), url))
+                continue
+            print(f"Inlining {kind}: {asset_path}")
+            edits.append((match.start(), match.end(),
+                          self.css_block(asset_path) if is_css else self.js_block(asset_path)))
+        return edits
+
+    def missing_edits(self, html_content, inlined):
+        """Edits adding indexed assets whose contents the page does not already reference"""
+        head = HEAD_CLOSE_PATTERN.search(html_content)
+        body = None
+        for body in BODY_CLOSE_PATTERN.finditer(html_content):
+            pass
+        edits = []
+        for asset in self.index.missing(local_references(html_content) | inlined):
+            if asset.endswith('.css') and head:
+                print(f"Adding missing CSS: {asset}")
+                edits.append((head.start(), head.start(), self.css_block(asset) + '\n'))
+            elif asset.endswith('.js') and body:
+                print(f"Adding missing JavaScript: {asset}")
+                edits.append((body.start(), body.start(), self.js_block(asset) + '\n'))
+        return edits
+
+    def inline(self, html_content, output_dir='.'):
+        """Return the page with its assets inlined (or fingerprinted beside output_dir)"""
+        if output_dir != self._output_dir:
+            # Processed CSS has url()s rebased for the previous output directory
+            self._processed = {path: text for path, text in self._processed.items() if not path.endswith('.css')}
+            self._rules = {}
+        self._output_dir = output_dir
+        self.used = set()
+        self.render_blocking = []
+        self._page_purged = None
+        self._page_media = []
+        self.inlined = {}
+        if self.critical or self.purge:
+            self._document = Document(html_content)
+        if self.critical:
+            self._document.mark_fold(self.fold_sections)
+        if self.purge:
+            self.use_page(self._document, linked_scripts(html_content))
+        inlined = set()
+        edits = self.linked_edits(html_content, inlined)
+        if self.mode == 'complete':
+            edits += self.missing_edits(html_content, inlined)
+        if self.purge or self.data_uris or self.mode == 'fingerprint':
+            edits += self.style_edits(html_content)
+        if self.data_uris or self.mode == 'fingerprint':
+            edits += self.image_edits(html_content)
+        # References no other edit replaced still point from the site root.
+        # The edits are disjoint, so sorted by start their ends rise too and
+        # one sweep finds the first that could overlap each rebase edit
+        edits.sort(key=lambda edit: (edit[0], edit[1]))
+        rebased = []
+        index = 0
+        for edit in sorted(rebase_edits(html_content, output_dir, (self.fingerprint_dir + '/',))):
+            while index < len(edits) and edits[index][1] <= edit[0]:
+                index += 1
+            if index == len(edits) or edits[index][0] >= edit[1]:
+                rebased.append(edit)
+        edits += rebased
+        # Insertions sort before a replacement starting at the same offset
+        edits.sort(key=lambda edit: (edit[0], edit[1]))
+
+        parts = []
+        position = 0
+        for start, end, text in edits:
+            parts.append(html_content[position:start])
+            parts.append(text)
+            position = end
+        parts.append(html_content[position:])
+        return ''.join(parts)
+
+def inline_file(input_file, output_file, mode, compress=False, budget=None, compress_workers=None, **options):
+    """Inline input_file into output_file unless the build cache says it is fresh.
+
+    options are AssetInliner keyword arguments (see inliner_options). With
+    compress, .gz/.br variants of the output and the files it loads are
+    written; a page over budget gzipped bytes exits with status 1.
+    """
+    if not os.path.exists(input_file):
+        print(f"Error: {input_file} not found!")
+        return
+
+    print(f"Reading {input_file}...")
+    with open(input_file, 'r', encoding='utf-8') as f:
+        html_content = f.read()
+
+    # Skip the rebuild when the page, its assets and the inliner are unchanged
+    inliner = AssetInliner(mode, **options)
+    cache = BuildCache()
+    dependencies = inliner.referenced_assets(html_content) + [asset_rules.__file__, css_rules.__file__,
+                                                              minify_assets.__file__]
+    key = cache.key(__file__, dict(options, mode=mode, output=output_file), input_file, dependencies)
+    if cache.is_fresh(output_file, key):
+        print(f"{output_file} is up to date.")
+        with open(output_file, 'r', encoding='utf-8') as f:
+            rows, total = page_weight(f.read())
+        files = cache.files(output_file)
+    else:
+        print("Inlining CSS and JavaScript files...")
+        html_content = inliner.inline(html_content, os.path.dirname(output_file) or '.')
+
+        print(f"Writing self-contained HTML to {output_file}...")
+        with open(output_file, 'w', encoding='utf-8') as f:
+            f.write(html_content)
+
+        files = inliner.page_files()
+        cache.record(output_file, key, dependencies, files)
+        cache.save()
+
+        print_purged(inliner.page_purged())
+        print_savings(inliner.page_savings())
+        print_data_uris(inliner.page_data_uris())
+        print_render_blocking(inliner.render_blocking)
+        rows, total = page_weight(html_content, inliner.page_parts())
+        print_page_weight(output_file, rows, total)
+        print("Done! The self-contained HTML file has been created.")
+        print(f"Original size: {os.path.getsize(input_file)} bytes")
+        print(f"New size: {os.path.getsize(output_file)} bytes")
+
+    if compress:
+        print_compressed(compress_files([output_file] + files, compress_workers))
+    print(cache.summary())
+    if not within_budget(output_file, total, budget):
+        sys.exit(1)
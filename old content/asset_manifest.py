@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Shared URL -> local path manifest written by download_assets.py and read by
+update_urls.py, so rewritten pages always point at what was actually downloaded.
+"""
+
+import hashlib
+import json
+import os
+import posixpath
+import threading
+import urllib.parse
+
+MANIFEST_NAME = '.download_manifest.json'
+
+def create_local_path(url, base_dir="assets"):
+    """Create a local file path for a URL"""
+    parsed = urllib.parse.urlparse(url)
+
+    # Create a safe filename from the URL
+    path_parts = parsed.netloc.split('.')
+    if len(path_parts) > 2:
+        # For subdomains, use the main domain
+        domain = '.'.join(path_parts[-2:])
+    else:
+        domain = parsed.netloc
+
+    # Get the path and filename
+    path = parsed.path
+    if not path or path == '/':
+        path = '/index.html'
+
+    # Create local path
+    local_path = posixpath.join(base_dir, domain, path.lstrip('/'))
+
+    # Ensure we have a filename
+    if not posixpath.basename(local_path):
+        local_path = posixpath.join(local_path, 'index.html')
+
+    return local_path
+
+def disambiguate_path(local_path, url):
+    """Derive a collision-free variant of local_path that depends only on url"""
+    stem, extension = posixpath.splitext(local_path)
+    tag = hashlib.sha1(url.encode('utf-8')).hexdigest()[:8]
+    return f"{stem}.{tag}{extension}"
+
+class AssetManifest:
+    """Persistent per-URL record of local path, validators, size and hash.
+
+    Paths are assigned once and kept across runs. When two URLs derive the
+    same path (e.g. storage.googleapis.com and fonts.googleapis.com, or ?v=
+    variants), the URL that claims it first keeps it and later URLs get a
+    hash-suffixed variant; seeds are claimed in sorted order.
+    """
+
+    def __init__(self, path=None, load=True):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries = {}
+        if path and load and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable manifest {path}: {e}")
+        self._owners = {entry['path']: url for url, entry in self.entries.items() if entry.get('path')}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, url):
+        """A copy of url's entry (or None), unaffected by later record() calls"""
+        with self._lock:
+            entry = self.entries.get(url)
+            return dict(entry) if entry is not None else None
+
+    def assign(self, url, base_dir="assets"):
+        """Return the local path for url, claiming a free one if it has none yet"""
+        with self._lock:
+            entry = self.entries.setdefault(url, {})
+            if entry.get('path'):
+                return entry['path']
+            local_path = create_local_path(url, base_dir)
+            while self._owners.get(local_path, url) != url:
+                local_path = disambiguate_path(local_path, url)
+            self._owners[local_path] = url
+            entry['path'] = local_path
+            return local_path
+
+    def record(self, url, **fields):
+        with self._lock:
+            self.entries.setdefault(url, {}).update(fields)
+
+    def lookup(self, url):
+        """Return the local path of a successfully downloaded URL, or None.
+
+        A #fragment on url is carried over to the returned path.
+        """
+        url, fragment = urllib.parse.urldefrag(url)
+        entry = self.entries.get(url)
+        if entry and entry.get('sha256'):
+            return f"{entry['path']}#{fragment}" if fragment else entry['path']
+        return None
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+
+def load_manifest(base_dir="assets", path=None):
+    """Load the manifest written by download_assets.py for base_dir"""
+    return AssetManifest(path or posixpath.join(base_dir, MANIFEST_NAME))
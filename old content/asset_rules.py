@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Rules deciding which referenced URLs are real page assets worth mirroring,
+as opposed to trackers, beacons, API endpoints and navigation links.
+"""
+
+import json
+import re
+import urllib.parse
+from collections import Counter
+
+# Hosts that only serve analytics, ads or tracking beacons
+DEFAULT_DENY_HOSTS = [
+    'googletagmanager.com',
+    'google-analytics.com',
+    'doubleclick.net',
+    'linkedin.com',
+    'licdn.com',
+    'facebook.com',
+    'facebook.net',
+    'analytics.tiktok.com',
+    't.niwapproval.io',
+    'sentry.neverbounce.com',
+]
+
+# Paths of dynamic endpoints rather than static files
+DEFAULT_DENY_PATHS = [
+    r'/collect\b',
+    r'/analytics/',
+    r'/observations/',
+    r'/api/',
+    r'/v\d+/(?:track|pixel|event)',
+    r'/gtag/js',
+]
+
+# <link rel=...> values that load something the page needs
+ASSET_LINK_RELS = {
+    'stylesheet', 'icon', 'shortcut', 'apple-touch-icon', 'apple-touch-icon-precomposed',
+    'mask-icon', 'manifest', 'preload', 'modulepreload', 'prefetch',
+}
+
+# <meta> properties whose content is an image the page references
+ASSET_META_NAMES = {
+    'og:image', 'og:image:url', 'og:image:secure_url', 'twitter:image', 'msapplication-tileimage',
+}
+
+# Tag/attribute pairs that always load a resource
+ASSET_ATTRIBUTES = {
+    ('script', 'src'), ('img', 'src'), ('img', 'srcset'), ('source', 'src'), ('source', 'srcset'),
+    ('video', 'src'), ('video', 'poster'), ('audio', 'src'), ('input', 'src'), ('embed', 'src'),
+    ('object', 'data'),
+}
+
+def host_matches(host, patterns):
+    """Whether host equals one of patterns or is a subdomain of one"""
+    return any(host == pattern or host.endswith('.' + pattern) for pattern in patterns)
+
+class AssetRules:
+    """Host and path allow/deny lists plus attribute-aware classification.
+
+    An allow list, when non-empty, must match; a deny list match always
+    rejects. Path patterns are regular expressions searched in the URL path.
+    """
+
+    def __init__(self, allow_hosts=None, deny_hosts=None, allow_paths=None, deny_paths=None):
+        self.allow_hosts = list(allow_hosts or [])
+        self.deny_hosts = list(DEFAULT_DENY_HOSTS if deny_hosts is None else deny_hosts)
+        self.allow_paths = [re.compile(p) for p in allow_paths or []]
+        self.deny_paths = [re.compile(p) for p in (DEFAULT_DENY_PATHS if deny_paths is None else deny_paths)]
+
+    @classmethod
+    def from_file(cls, path):
+        """Load rules from a JSON file with allow_hosts/deny_hosts/allow_paths/deny_paths keys"""
+        with open(path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        return cls(config.get('allow_hosts'), config.get('deny_hosts'),
+                   config.get('allow_paths'), config.get('deny_paths'))
+
+    def check_url(self, url):
+        """Apply the host and path lists; returns (allowed, reason)"""
+        parsed = urllib.parse.urlparse(url)
+        host = (parsed.hostname or '').lower()
+        if parsed.scheme not in ('http', 'https'):
+            return False, 'not-http'
+        if self.allow_hosts and not host_matches(host, self.allow_hosts):
+            return False, 'host-not-allowed'
+        if host_matches(host, self.deny_hosts):
+            return False, 'host-denied'
+        if self.allow_paths and not any(p.search(parsed.path) for p in self.allow_paths):
+            return False, 'path-not-allowed'
+        if any(p.search(parsed.path) for p in self.deny_paths):
+            return False, 'path-denied'
+        return True, 'asset'
+
+    def classify(self, url, tag=None, attribute=None, attrs=None):
+        """Decide whether a reference is a page asset; returns (allowed, reason).
+
+        tag/attribute describe where the URL was found (attribute 'url()' for
+        CSS references); attrs holds the element's other attributes, used for
+        link rel and meta name/property.
+        """
+        kind = reference_kind(tag, attribute, attrs or {})
+        if kind != 'asset':
+            return False, kind
+        return self.check_url(url)
+
+def reference_kind(tag, attribute, attrs):
+    """Classify where a URL appeared: 'asset', or why it is not one"""
+    if tag is None or attribute in ('url()', '@import', 'data-src', 'data-srcset'):
+        return 'asset'
+    if tag == 'link' and attribute == 'href':
+        rels = set((attrs.get('rel') or '').lower().split())
+        return 'asset' if rels & ASSET_LINK_RELS else 'link-' + ('-'.join(sorted(rels)) or 'norel')
+    if tag == 'meta' and attribute == 'content':
+        name = (attrs.get('property') or attrs.get('name') or '').lower()
+        return 'asset' if name in ASSET_META_NAMES else 'meta'
+    if (tag, attribute) in ASSET_ATTRIBUTES:
+        return 'asset'
+    if tag in ('a', 'area', 'form'):
+        return 'navigation'
+    if tag in ('iframe', 'frame'):
+        return 'frame'
+    return f'{tag}-{attribute}'
+
+def plan_downloads(references, rules):
+    """Split (url, tag, attribute, attrs) references into URLs to fetch and skipped URLs.
+
+    A URL is fetched if any of its references classifies as an asset;
+    fragments are dropped since they never change what is downloaded.
+    Returns (urls_to_fetch, {url: reason}, Counter of reasons).
+    """
+    fetch = set()
+    skipped = {}
+    for url, tag, attribute, attrs in references:
+        url = urllib.parse.urldefrag(url)[0]
+        allowed, reason = rules.classify(url, tag, attribute, attrs)
+        if allowed:
+            fetch.add(url)
+            skipped.pop(url, None)
+        elif url not in fetch:
+            skipped.setdefault(url, reason)
+    return fetch, skipped, Counter(skipped.values())
+
+def print_plan(fetch, skipped, reasons, verbose=False):
+    """Report what will and will not be downloaded"""
+    print(f"Plan: {len(fetch)} URLs to download, {len(skipped)} skipped")
+    for reason, count in reasons.most_common():
+        print(f"  skipped {count:4d} {reason}")
+    if verbose:
+        for url in sorted(skipped):
+            print(f"  - [{skipped[url]}] {url}")
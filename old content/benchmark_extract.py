@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Benchmark the streaming URL extractor in download_assets.py, one regex
+tokenizer pass shared with update_urls.py, against the original five-regex
+scan, on real pages and on a synthetic page of a given size.
+
+    python3 benchmark_extract.py                  # *.html here and in ../
+    python3 benchmark_extract.py page.html --synthetic-mb 10 --repeat 5
+"""
+
+import argparse
+import glob
+import os
+import re
+import tempfile
+import time
+import tracemalloc
+
+from download_assets import iter_references
+
+# The scan download_assets.py used before the tokenizer: five independent
+# passes over the whole document, blind to tags, comments and scripts
+LEGACY_PATTERNS = [
+    r'href=["\']([^"\']+)["\']',
+    r'src=["\']([^"\']+)["\']',
+    r'url\(["\']?([^"\')\s]+)["\']?\)',
+    r'content=["\']([^"\']+)["\']',
+    r'data-src=["\']([^"\']+)["\']',
+]
+
+# One block of the synthetic page: every kind of reference the extractor
+# handles, plus URLs in a comment and a script that it must ignore
+SYNTHETIC_BLOCK = '''
+<div class="card" style="background-image: url('https://cdn.example.com/bg/{n}.jpg')">
+  <link rel="stylesheet" href="https://cdn.example.com/css/{n}.css">
+  <img src="https://img.example.com/{n}.png" alt="Card {n}"
+       srcset="https://img.example.com/{n}-1x.png 1x, https://img.example.com/{n}-2x.png 2x">
+  <a href="https://www.example.com/page/{n}">Read more</a>
+  <!-- <img src="https://img.example.com/commented-{n}.png"> -->
+  <script>var tracker = "https://track.example.com/{n}"; el.src="https://img.example.com/js-{n}.png";</script>
+  <style>.card-{n} {{ background: url(https://cdn.example.com/style/{n}.svg); }}</style>
+  <p>Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor.</p>
+</div>
+'''
+
+def legacy_extract_urls(html_content):
+    urls = set()
+    for pattern in LEGACY_PATTERNS:
+        for match in re.findall(pattern, html_content, re.IGNORECASE):
+            if match.startswith('http'):
+                urls.add(match)
+    return urls
+
+def streaming_extract_urls(source):
+    with source:
+        return {url for url, tag, attribute, context in iter_references(source)}
+
+def synthetic_page(size):
+    """Build an HTML document of roughly size characters"""
+    parts = ['<!DOCTYPE html>\n<html><head><title>Synthetic</title></head><body>']
+    length = len(parts[0])
+    n = 0
+    while length < size:
+        block = SYNTHETIC_BLOCK.format(n=n)
+        parts.append(block)
+        length += len(block)
+        n += 1
+    parts.append('</body></html>\n')
+    return ''.join(parts)
+
+def measure(function, argument, repeat):
+    """Return (result, best seconds, peak traced bytes) over repeat runs"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(argument())
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    function(argument())
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, best, peak
+
+def benchmark(name, html_content, repeat, open_stream):
+    size = len(html_content)
+    legacy, legacy_time, legacy_peak = measure(legacy_extract_urls, lambda: html_content, repeat)
+    streaming, streaming_time, streaming_peak = measure(streaming_extract_urls, open_stream, repeat)
+    print(f"{name}: {size / 1e6:.2f} MB")
+    print(f"  five regexes: {len(legacy):5d} URLs in {legacy_time * 1000:8.1f} ms "
+          f"({size / legacy_time / 1e6:6.1f} MB/s), peak {legacy_peak / 1e6:.2f} MB")
+    print(f"  tokenizer:    {len(streaming):5d} URLs in {streaming_time * 1000:8.1f} ms "
+          f"({size / streaming_time / 1e6:6.1f} MB/s), peak {streaming_peak / 1e6:.2f} MB")
+    print(f"  only regexes: {len(legacy - streaming)} (scripts, comments, unsplit srcset), "
+          f"only tokenizer: {len(streaming - legacy)}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark HTML URL extraction")
+    parser.add_argument('pages', nargs='*', help="Pages to benchmark (default: the site's pages)")
+    parser.add_argument('--synthetic-mb', type=float, default=10, help="Size of the synthetic page, 0 to skip")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per extractor; the best is reported")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    pages = args.pages or sorted(glob.glob('*.html') + glob.glob(os.path.join('..', '*.html')))
+    # Skip build outputs, which have everything inlined
+    pages = [page for page in pages if 'self_contained' not in page]
+
+    for page in pages:
+        with open(page, 'r', encoding='utf-8') as f:
+            html_content = f.read()
+        benchmark(page, html_content, args.repeat, lambda: open(page, 'r', encoding='utf-8'))
+
+    if args.synthetic_mb:
+        html_content = synthetic_page(int(args.synthetic_mb * 1e6))
+        # Stream the synthetic page from disk too, like a real page
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'synthetic.html')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(html_content)
+            benchmark(f"synthetic {args.synthetic_mb:g} MB page", html_content, args.repeat,
+                      lambda: open(path, 'r', encoding='utf-8'))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Incremental build cache shared by update_urls.py, asset_inliner.py (behind
+inline_assets.py and inline_all_assets.py) and build_site.py. An output is
+only rebuilt when the hash of its input page, the assets it references, the
+tool's source or the tool configuration changes.
+"""
+
+import hashlib
+import json
+import os
+
+CACHE_NAME = '.build_cache.json'
+
+class BuildCache:
+    """Persistent map of output path -> hash key of everything it was built from"""
+
+    def __init__(self, path=CACHE_NAME):
+        # path=None gives an in-memory cache used only for hashing
+        self.path = path
+        self.entries = {}
+        self._digests = {}
+        self.hits = 0
+        self.misses = 0
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable build cache {path}: {e}")
+
+    def file_digest(self, path):
+        """SHA-256 of a file's contents, memoized for this run; 'missing' if absent"""
+        digest = self._digests.get(path)
+        if digest is None:
+            try:
+                with open(path, 'rb') as f:
+                    digest = hashlib.sha256(f.read()).hexdigest()
+            except OSError:
+                digest = 'missing'
+            self._digests[path] = digest
+        return digest
+
+    def key(self, tool, config, input_path, dependencies=()):
+        """Hash the tool source, its configuration, the input and its dependencies"""
+        h = hashlib.sha256()
+        h.update(self.file_digest(tool).encode())
+        h.update(json.dumps(config, sort_keys=True).encode())
+        h.update(self.file_digest(input_path).encode())
+        for dependency in sorted(set(dependencies)):
+            h.update(dependency.encode())
+            h.update(self.file_digest(dependency).encode())
+        return h.hexdigest()
+
+    def is_fresh(self, output_path, key):
+        """Whether output_path exists and was built from exactly this key"""
+        entry = self.entries.get(output_path)
+        fresh = bool(entry) and entry.get('key') == key and os.path.exists(output_path)
+        if fresh:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return fresh
+
+    def record(self, output_path, key, dependencies=(), files=()):
+        """Remember output_path's key, its dependencies and the separate files it loads"""
+        self.entries[output_path] = {'key': key, 'dependencies': sorted(set(dependencies)),
+                                     'files': sorted(set(files))}
+
+    def files(self, output_path):
+        """Separate files recorded for output_path, so a cache hit can still compress them"""
+        return self.entries.get(output_path, {}).get('files', [])
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def summary(self):
+        return f"Build cache: {self.hits} hits, {self.misses} rebuilt"
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Batch build for the landing pages (index.html, book.html, bookv2.html,
+book_down.html, ...): rewrite external URLs to the local mirror and inline
+CSS/JS for every page matching a glob, spread across a process pool. Each
+built page gets a gzipped page-weight breakdown; --compress writes .gz/.br
+variants and --budget fails the build when a page is too heavy. With
+--hoist-shared, inline CSS rules and scripts every page repeats are first
+moved into shared files (see hoist_shared.py).
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import asset_inliner
+import asset_manifest
+import asset_rules
+import compress_outputs
+import css_rules
+import hoist_shared
+import minify_assets
+import update_urls
+from asset_inliner import (AssetInliner, add_inliner_arguments, inliner_options, print_data_uris, print_purged,
+                            print_render_blocking, rebase_page)
+from asset_manifest import MANIFEST_NAME, load_manifest
+from build_cache import BuildCache
+from hoist_shared import OUTPUT_SUFFIX as HOISTED_SUFFIX
+from hoist_shared import hoist, plan_hoisting, print_plan, write_shared_files
+from compress_outputs import (add_compress_arguments, compress_files, page_weight, print_compressed, print_page_weight,
+                              within_budget)
+from minify_assets import print_savings
+from update_urls import UrlRewriter
+
+# Output file suffix for each build mode
+OUTPUT_SUFFIXES = {
+    'rewrite': '_local.html',
+    'inline': '_self_contained.html',
+    'complete': '_complete_self_contained.html',
+    'fingerprint': '_fingerprinted.html',
+}
+DEFAULT_PAGES = ['index.html', 'book*.html']
+
+# Per-process state, loaded once by init_worker and only read afterwards
+_worker = {}
+
+# Source files whose changes invalidate every built page
+TOOL_SOURCES = [__file__, asset_inliner.__file__, asset_manifest.__file__, asset_rules.__file__,
+                compress_outputs.__file__, css_rules.__file__, hoist_shared.__file__, minify_assets.__file__,
+                update_urls.__file__]
+
+def init_worker(base_dir, manifest_path, mode, options):
+    """Load the shared manifest and set up the inliner, whose asset cache lives as long as this process"""
+    _worker['manifest'] = load_manifest(base_dir, manifest_path)
+    _worker['inliner'] = AssetInliner(mode, **options) if mode != 'rewrite' else None
+    _worker['hasher'] = BuildCache(path=None)
+
+def output_path(page, output_dir, mode):
+    stem = os.path.splitext(os.path.basename(page))[0]
+    return os.path.join(output_dir, stem + OUTPUT_SUFFIXES[mode])
+
+def build_page(page, output_dir, mode, options, cached_key=None, plan=None):
+    """Rewrite, hoist shared blocks per plan, and inline one page unless its cache key is unchanged.
+
+    Returns a dict with page, output, key, dependencies, built, input and
+    output sizes in bytes, seconds, purged and minification savings, data
+    URIs, render-blocking CSS sizes, the gzipped page weight and its
+    breakdown, and the separate files the page loads.
+    """
+    start = time.perf_counter()
+    with open(page, 'r', encoding='utf-8') as f:
+        html_content = f.read()
+    output = output_path(page, output_dir, mode)
+
+    html_content = UrlRewriter(_worker['manifest']).rewrite(html_content)
+    if plan:
+        html_content = hoist(html_content, plan)
+
+    # The page's cache key covers the assets it references after rewriting
+    inliner = _worker['inliner']
+    dependencies = [_worker['manifest'].path] + TOOL_SOURCES
+    if inliner:
+        dependencies += inliner.referenced_assets(html_content)
+    config = dict(options, mode=mode, shared=sorted(plan['files']) if plan else [])
+    key = _worker['hasher'].key(__file__, config, page, dependencies)
+    result = dict(page=page, output=output, key=key, dependencies=dependencies, built=False,
+                  purged=[], savings=[], data_uris=([], []), render_blocking=[], files=[])
+    if key != cached_key or not os.path.exists(output):
+        if inliner:
+            html_content = inliner.inline(html_content, os.path.dirname(output))
+            result['purged'] = inliner.page_purged()
+            result['savings'] = inliner.page_savings()
+            result['data_uris'] = inliner.page_data_uris()
+            result['render_blocking'] = inliner.render_blocking
+            result['files'] = inliner.page_files()
+        else:
+            # Hoisted files are already relative to the output directory
+            html_content = rebase_page(html_content, os.path.dirname(output), (options['fingerprint_dir'] + '/',))
+        with open(output, 'w', encoding='utf-8') as f:
+            f.write(html_content)
+        result['built'] = True
+        result['weight'] = page_weight(html_content, inliner.page_parts() if inliner else [])
+    else:
+        with open(output, 'r', encoding='utf-8') as f:
+            result['weight'] = page_weight(f.read())
+    result.update(original_size=os.path.getsize(page), new_size=os.path.getsize(output),
+                  seconds=time.perf_counter() - start)
+    return result
+
+def find_pages(patterns):
+    """Expand page globs, skipping outputs of earlier builds"""
+    pages = set()
+    for pattern in patterns:
+        for page in glob.glob(pattern):
+            if not page.endswith(tuple(OUTPUT_SUFFIXES.values()) + (HOISTED_SUFFIX,)):
+                pages.add(page)
+    return sorted(pages)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Rewrite and inline several pages in parallel")
+    parser.add_argument('pages', nargs='*', default=DEFAULT_PAGES, help="Page files or globs")
+    parser.add_argument('--mode', choices=sorted(OUTPUT_SUFFIXES), default='inline',
+                        help="rewrite URLs only, also inline CSS/JS, also add missing known assets, "
+                             "or link content-hashed copies of assets instead of inlining")
+    parser.add_argument('--root', default='.', help="Directory containing the pages and assets/")
+    parser.add_argument('--base-dir', default='assets', help="Asset mirror directory under --root")
+    parser.add_argument('--manifest', help=f"Download manifest (default: <base-dir>/{MANIFEST_NAME})")
+    parser.add_argument('--output-dir', default='.', help="Where to write built pages, under --root; their relative references are rebased to it")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help="Number of worker processes")
+    parser.add_argument('--force', action='store_true', help="Rebuild pages even if the cache says they are fresh")
+    parser.add_argument('--hoist-shared', action='store_true',
+                        help="Move inline CSS rules and scripts that every page repeats into shared cacheable files")
+    add_inliner_arguments(parser)
+    add_compress_arguments(parser)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    # Asset paths in the pages are relative to the site root
+    os.chdir(args.root)
+
+    pages = find_pages(args.pages)
+    if not pages:
+        print("Error: no pages matched!")
+        return
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    cache = BuildCache()
+    options = dict(inliner_options(args), assets_dir=args.base_dir, manifest_path=args.manifest)
+
+    def cached_key(page):
+        if args.force:
+            return None
+        return cache.entries.get(output_path(page, args.output_dir, args.mode), {}).get('key')
+
+    start = time.perf_counter()
+    plan = None
+    shared_files = []
+    if args.hoist_shared:
+        # Compare the pages as the workers will see them, after URL rewriting
+        rewriter = UrlRewriter(load_manifest(args.base_dir, args.manifest))
+        rewritten = {}
+        for page in pages:
+            with open(page, 'r', encoding='utf-8') as f:
+                rewritten[page] = rewriter.rewrite(f.read())
+        plan = plan_hoisting(rewritten, args.fingerprint_dir)
+        print_plan(plan, pages)
+        shared_files = write_shared_files(plan, args.output_dir)
+
+    print(f"Building {len(pages)} pages with {args.workers} workers ({args.mode} mode)...")
+    results = []
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker,
+                             initargs=(args.base_dir, args.manifest, args.mode, options)) as executor:
+        futures = [executor.submit(build_page, page, args.output_dir, args.mode, options, cached_key(page), plan)
+                   for page in pages]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if result['built']:
+                cache.misses += 1
+                cache.record(result['output'], result['key'], result['dependencies'], result['files'])
+                print(f"{result['page']} -> {result['output']}: {result['original_size']} -> "
+                      f"{result['new_size']} bytes in {result['seconds']:.2f}s")
+                print_purged(result['purged'])
+                print_savings(result['savings'])
+                print_data_uris(result['data_uris'])
+                print_render_blocking(result['render_blocking'])
+                print_page_weight(result['output'], *result['weight'])
+            else:
+                cache.hits += 1
+                result['files'] = cache.files(result['output'])
+                print(f"{result['page']} -> {result['output']}: up to date")
+
+    cache.save()
+    if args.compress:
+        files = [result['output'] for result in results] + shared_files
+        files += [path for result in results for path in result['files']]
+        print_compressed(compress_files(files, args.compress_workers))
+    print(f"Done! Built {len(pages)} pages in {time.perf_counter() - start:.2f}s")
+    print(cache.summary())
+
+    over_budget = [result['output'] for result in sorted(results, key=lambda result: result['output'])
+                   if not within_budget(result['output'], result['weight'][1], args.budget)]
+    if over_budget:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
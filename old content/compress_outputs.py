@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Precompressed variants and page-weight budgets for built pages.
+
+Every output (and every fingerprinted or deferred asset) gets a .gz beside
+it at maximum compression, plus a .br when the brotli module is installed,
+so a static server can send them as they are. Files are compressed in a
+process pool.
+
+    python3 compress_outputs.py index_complete_self_contained.html --budget 300000
+"""
+
+import argparse
+import gzip
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Images and woff2 are already compressed and gain nothing
+COMPRESSIBLE_EXTENSIONS = ('.html', '.htm', '.css', '.js', '.mjs', '.json', '.svg', '.txt', '.xml',
+                           '.ico', '.ttf', '.otf')
+PAGE_MARKUP = 'page markup and inline blocks'
+
+def gzip_bytes(data):
+    # mtime=0 keeps the .gz identical across builds of the same file
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+def brotli_bytes(data):
+    return brotli.compress(data, quality=11)
+
+def write_atomic(path, data):
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+def compress_file(path):
+    """Write path.gz (and path.br) beside path; return (path, raw, gzip, brotli or None) sizes"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    gzipped = gzip_bytes(data)
+    write_atomic(path + '.gz', gzipped)
+    brotli_size = None
+    if brotli is not None:
+        compressed = brotli_bytes(data)
+        write_atomic(path + '.br', compressed)
+        brotli_size = len(compressed)
+    return path, len(data), len(gzipped), brotli_size
+
+def compress_files(paths, workers=None):
+    """Precompress the compressible files among paths in a process pool"""
+    paths = sorted({path for path in paths if path.lower().endswith(COMPRESSIBLE_EXTENSIONS)
+                    and os.path.exists(path)})
+    if not paths:
+        return []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(compress_file, paths))
+
+def print_compressed(results):
+    """Report sizes from compress_file() tuples"""
+    if not results:
+        return
+    print("Precompressed outputs:")
+    for path, raw, gzipped, brotli_size in results:
+        line = f"  {path}: {raw} -> {gzipped} bytes .gz"
+        if brotli_size is not None:
+            line += f", {brotli_size} bytes .br"
+        print(line)
+    if brotli is None:
+        print("  (brotli module not installed: no .br variants)")
+
+def page_weight(html_content, parts=()):
+    """Return ([(label, raw bytes, gzip bytes)], page gzip bytes) for a built page.
+
+    parts are (label, text) for what was inlined. Each is compressed on its
+    own; whatever is left of the whole page's compressed size is attributed
+    to the page's own markup. Parts compress slightly better in context, so
+    the attribution is approximate.
+    """
+    total = len(gzip_bytes(html_content.encode('utf-8')))
+    rows = []
+    for label, text in parts:
+        data = text.encode('utf-8')
+        rows.append((label, len(data), len(gzip_bytes(data))))
+    rows.sort(key=lambda row: row[2], reverse=True)
+    raw = len(html_content.encode('utf-8')) - sum(row[1] for row in rows)
+    rows.append((PAGE_MARKUP, max(raw, 0), max(total - sum(row[2] for row in rows), 0)))
+    return rows, total
+
+def print_page_weight(page, rows, total):
+    print(f"Page weight of {page}: {total} bytes gzipped")
+    for label, raw, gzipped in rows:
+        print(f"  {label}: {raw} bytes raw, {gzipped} bytes gzipped ({100 * gzipped / max(total, 1):.1f}%)")
+
+def within_budget(page, total, budget):
+    """Print and return whether a page's gzipped weight fits budget (None means no budget)"""
+    if budget is None:
+        return True
+    if total > budget:
+        print(f"Error: {page} weighs {total} bytes gzipped, over the {budget} byte budget by {total - budget}")
+        return False
+    print(f"{page}: {total} of {budget} budget bytes gzipped")
+    return True
+
+def add_compress_arguments(parser):
+    """Add precompression and budget options to an argparse parser"""
+    parser.add_argument('--compress', action='store_true',
+                        help="Write .gz (and .br with the brotli module) beside every output")
+    parser.add_argument('--budget', type=int,
+                        help="Fail the build when a page exceeds this many gzipped bytes")
+    parser.add_argument('--compress-workers', type=int, default=os.cpu_count(),
+                        help="Number of compression processes")
+
+def compress_options(args):
+    """inline_file keyword arguments from parsed add_compress_arguments options"""
+    return {'compress': args.compress, 'budget': args.budget, 'compress_workers': args.compress_workers}
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompress built files and check page-weight budgets")
+    parser.add_argument('files', nargs='+', help="Built pages and assets")
+    parser.add_argument('--budget', type=int, help="Fail when a page exceeds this many gzipped bytes")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Number of compression processes")
+    args = parser.parse_args()
+    ok = True
+    for path in args.files:
+        if path.lower().endswith(('.html', '.htm')):
+            with open(path, 'r', encoding='utf-8') as f:
+                rows, total = page_weight(f.read())
+            ok = within_budget(path, total, args.budget) and ok
+    print_compressed(compress_files(args.files, args.workers))
+    if not ok:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
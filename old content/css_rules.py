@@ -0,0 +1,611 @@
+#!/usr/bin/env python3
+"""
+Small CSS rule parser and selector matcher used by the inliner's critical-CSS
+and purge modes. Stylesheets are split into rules and at-rules (not
+declarations), and selectors are matched against a lightweight element tree
+built from the page with html.parser.
+
+Matching errs on the side of keeping CSS: pseudo-classes such as :hover,
+:nth-child() or :not() are treated as satisfied, and + is treated like ~.
+"""
+
+import re
+from html.parser import HTMLParser
+
+# At-rules whose block holds further rules rather than declarations
+GROUPING_AT_RULES = {'media', 'supports', 'document', '-moz-document', 'layer', 'container'}
+
+# Elements that never have children or a closing tag
+VOID_ELEMENTS = {
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'param',
+    'source', 'track', 'wbr',
+}
+
+# Top-level page regions counted when deciding what is above the fold
+FOLD_SECTION_TAGS = {'section', 'header', 'nav', 'main', 'footer', 'article'}
+FOLD_SECTIONS = 4
+
+CSS_STRIP_PATTERN = re.compile(r'(/\*.*?\*/)|("(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\')', re.DOTALL)
+IDENTIFIER = r'(?:[\w-]|\\.|[^\x00-\x7f])+'
+SELECTOR_TOKEN_PATTERN = re.compile(
+    r'(?P<combinator>\s*[>+~]\s*|\s+)'
+    rf'|(?P<tag>\*|{IDENTIFIER})'
+    rf'|#(?P<id>{IDENTIFIER})'
+    rf'|\.(?P<class>{IDENTIFIER})'
+    r'|\[\s*(?P<attribute>[^\]=~|^$*\s]+)\s*(?:(?P<operator>[~|^$*]?=)\s*'
+    r'(?P<value>"[^"]*"|\'[^\']*\'|[^\]\s]+)\s*(?P<flag>[iIsS])?\s*)?\]'
+    rf'|::?(?P<pseudo>{IDENTIFIER})(?P<arguments>\((?:[^()]|\([^()]*\))*\))?'
+)
+ESCAPE_PATTERN = re.compile(r'\\([0-9a-fA-F]{1,6}\s?|.)')
+STRING_PATTERNS = {
+    '"': re.compile(r'"(?:[^"\\]|\\.)*"', re.DOTALL),
+    "'": re.compile(r"'(?:[^'\\]|\\.)*'", re.DOTALL),
+}
+KEYFRAMES_AT_RULES = {'keyframes', '-webkit-keyframes', '-moz-keyframes'}
+
+# Declared property names; shorthands and longhands share the first word
+PROPERTY_PATTERN = re.compile(r'(?:^|;)\s*(--[\w-]+|(?:-[a-z]+-)?[a-z][\w-]*)\s*:', re.IGNORECASE)
+PSEUDO_ELEMENTS = {'before', 'after', 'first-line', 'first-letter', 'placeholder', 'selection', 'marker'}
+# Shorthands and aliases that set properties outside their own prefix family
+# (writing modes can map logical properties to either axis)
+SHORTHAND_LONGHANDS = {
+    'font': ('line-height',),
+    'gap': ('row-gap', 'column-gap'),
+    'grid-gap': ('row-gap', 'column-gap'),
+    'grid-row-gap': ('row-gap',),
+    'grid-column-gap': ('column-gap',),
+    'place-content': ('align-content', 'justify-content'),
+    'place-items': ('align-items', 'justify-items'),
+    'place-self': ('align-self', 'justify-self'),
+    'inset': ('top', 'right', 'bottom', 'left'),
+    'inset-block': ('top', 'right', 'bottom', 'left'),
+    'inset-inline': ('top', 'right', 'bottom', 'left'),
+    'inset-block-start': ('top', 'right', 'bottom', 'left'),
+    'inset-block-end': ('top', 'right', 'bottom', 'left'),
+    'inset-inline-start': ('top', 'right', 'bottom', 'left'),
+    'inset-inline-end': ('top', 'right', 'bottom', 'left'),
+    'inline-size': ('width', 'height'),
+    'block-size': ('width', 'height'),
+    'columns': ('column-width', 'column-count'),
+    'white-space': ('text-wrap',),
+    'word-wrap': ('overflow-wrap',),
+    'page-break-before': ('break-before',),
+    'page-break-after': ('break-after',),
+    'page-break-inside': ('break-inside',),
+}
+# The family of 'all', which resets every property
+ALL_PROPERTIES = '*'
+
+# Purging: words inside script string literals count as used names
+JS_STRING_PATTERN = re.compile(r'"(?:[^"\\\n]|\\.)*"|\'(?:[^\'\\\n]|\\.)*\'|`(?:[^`\\]|\\.)*`')
+NAME_PATTERN = re.compile(r'-?[A-Za-z_][\w-]*')
+
+def strip_comments(css):
+    """Remove comments, leaving strings that merely contain /* alone"""
+    return CSS_STRIP_PATTERN.sub(lambda m: m.group(2) or '', css)
+
+def unescape(identifier):
+    def replace(match):
+        escaped = match.group(1)
+        if re.match(r'[0-9a-fA-F]', escaped):
+            return chr(int(escaped.strip(), 16))
+        return escaped
+    return ESCAPE_PATTERN.sub(replace, identifier)
+
+class Rule:
+    """A style rule (selector and declarations) or an at-rule.
+
+    For at-rules, name is the at-keyword without '@', prelude the rest of
+    the header, and children the nested rules of grouping at-rules; other
+    at-rules keep their block in body, or None for statements like @import.
+    """
+
+    def __init__(self, prelude, body=None, children=None):
+        self.prelude = prelude
+        self.body = body
+        self.children = children
+        self.name = prelude[1:].split(None, 1)[0].split('(')[0].lower() if prelude.startswith('@') else None
+
+    @property
+    def selectors(self):
+        return split_selector_list(self.prelude)
+
+    def css(self):
+        if self.children is not None:
+            return f"{self.prelude}{{{serialize(self.children)}}}"
+        if self.body is None:
+            return f"{self.prelude};"
+        return f"{self.prelude}{{{self.body}}}"
+
+def find_block_end(css, start):
+    """Index of the '}' closing the block whose '{' is at start"""
+    depth = 0
+    i = start
+    while i < len(css):
+        char = css[i]
+        if char in STRING_PATTERNS:
+            match = STRING_PATTERNS[char].match(css, i)
+            i = match.end() if match else i + 1
+            continue
+        if char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                return i
+        i += 1
+    return len(css)
+
+def parse_stylesheet(css, comments_stripped=False):
+    """Parse CSS text into a list of Rule objects"""
+    if not comments_stripped:
+        css = strip_comments(css)
+    rules = []
+    i = 0
+    while i < len(css):
+        # Find the end of the prelude, skipping strings
+        j = i
+        while j < len(css) and css[j] not in '{;}':
+            if css[j] in STRING_PATTERNS:
+                match = STRING_PATTERNS[css[j]].match(css, j)
+                j = match.end() if match else j + 1
+            else:
+                j += 1
+        prelude = css[i:j].strip()
+        if j >= len(css):
+            break
+        if css[j] in ';}':
+            if prelude.startswith('@'):
+                rules.append(Rule(prelude))
+            i = j + 1
+            continue
+        end = find_block_end(css, j)
+        inner = css[j + 1:end]
+        rule = Rule(prelude, inner.strip())
+        if rule.name in GROUPING_AT_RULES:
+            rule.children = parse_stylesheet(inner, comments_stripped=True)
+            rule.body = None
+        if prelude:
+            rules.append(rule)
+        i = end + 1
+    return rules
+
+def serialize(rules):
+    return ''.join(rule.css() for rule in rules)
+
+def split_selector_list(selector_text):
+    """Split 'a, b:is(c, d)' into ['a', 'b:is(c, d)']"""
+    selectors = []
+    depth = 0
+    start = 0
+    for i, char in enumerate(selector_text):
+        if char in '([':
+            depth += 1
+        elif char in ')]':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            selectors.append(selector_text[start:i].strip())
+            start = i + 1
+    selectors.append(selector_text[start:].strip())
+    return [selector for selector in selectors if selector]
+
+class Compound:
+    """One compound selector: tag, ids, classes and attribute conditions"""
+
+    def __init__(self):
+        self.tag = None
+        self.ids = []
+        self.classes = []
+        self.attributes = []
+
+def parse_selector(selector):
+    """Parse a complex selector into ([Compound, ...], [combinator, ...]), or None if unsupported"""
+    compounds = [Compound()]
+    combinators = []
+    position = 0
+    selector = selector.strip()
+    while position < len(selector):
+        match = SELECTOR_TOKEN_PATTERN.match(selector, position)
+        if not match or match.end() == position:
+            return None
+        position = match.end()
+        if match.group('combinator') is not None:
+            combinators.append(match.group('combinator').strip() or ' ')
+            compounds.append(Compound())
+            continue
+        compound = compounds[-1]
+        if match.group('tag') is not None:
+            compound.tag = None if match.group('tag') == '*' else unescape(match.group('tag')).lower()
+        elif match.group('id') is not None:
+            compound.ids.append(unescape(match.group('id')))
+        elif match.group('class') is not None:
+            compound.classes.append(unescape(match.group('class')))
+        elif match.group('attribute') is not None:
+            value = match.group('value')
+            if value and value[0] in '"\'':
+                value = value[1:-1]
+            compound.attributes.append((match.group('attribute').lower(), match.group('operator'),
+                                        value, (match.group('flag') or '').lower() == 'i'))
+        elif match.group('pseudo') is not None and match.group('pseudo').lower() == 'root':
+            compound.tag = 'html'
+        # Other pseudo-classes and pseudo-elements are assumed to match
+    return compounds, combinators
+
+def attribute_matches(element, name, operator, expected, ignore_case):
+    actual = element.attrs.get(name)
+    if actual is None:
+        return False
+    if operator is None:
+        return True
+    if ignore_case:
+        actual, expected = actual.lower(), expected.lower()
+    if operator == '=':
+        return actual == expected
+    if operator == '~=':
+        return expected in actual.split()
+    if operator == '|=':
+        return actual == expected or actual.startswith(expected + '-')
+    if operator == '^=':
+        return bool(expected) and actual.startswith(expected)
+    if operator == '$=':
+        return bool(expected) and actual.endswith(expected)
+    if operator == '*=':
+        return bool(expected) and expected in actual
+    return False
+
+def compound_matches(compound, element):
+    if compound.tag and compound.tag != element.tag:
+        return False
+    if compound.ids and any(element.attrs.get('id') != id_ for id_ in compound.ids):
+        return False
+    if compound.classes and not element.classes.issuperset(compound.classes):
+        return False
+    return all(attribute_matches(element, *attribute) for attribute in compound.attributes)
+
+def complex_matches(element, compounds, combinators, k):
+    """Whether compounds[:k + 1] joined by combinators match with compounds[k] on element"""
+    if not compound_matches(compounds[k], element):
+        return False
+    if k == 0:
+        return True
+    combinator = combinators[k - 1]
+    if combinator == ' ':
+        ancestor = element.parent
+        while ancestor is not None:
+            if complex_matches(ancestor, compounds, combinators, k - 1):
+                return True
+            ancestor = ancestor.parent
+        return False
+    if combinator == '>':
+        return element.parent is not None and complex_matches(element.parent, compounds, combinators, k - 1)
+    # '+' and '~': any earlier sibling
+    if element.parent is None:
+        return False
+    siblings = element.parent.children
+    return any(complex_matches(sibling, compounds, combinators, k - 1)
+               for sibling in siblings[:element.index])
+
+class Element:
+    def __init__(self, tag, attrs, parent):
+        self.tag = tag
+        self.attrs = attrs
+        self.classes = set(attrs.get('class', '').split())
+        self.parent = parent
+        self.children = []
+        self.index = 0
+        self.above_fold = False
+
+class DocumentParser(HTMLParser):
+    """Build an Element tree from a page, tolerating unclosed and stray tags"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = Element('#document', {}, None)
+        self.stack = [self.root]
+        self.elements = []
+        # The page's own <style> blocks and style attributes
+        self.styles = []
+        self.style_blocks = []
+        self.scripts = []
+
+    def handle_starttag(self, tag, attrs):
+        parent = self.stack[-1]
+        element = Element(tag, {name: value or '' for name, value in attrs}, parent)
+        if element.attrs.get('style'):
+            self.styles.append(element.attrs['style'])
+        element.index = len(parent.children)
+        parent.children.append(element)
+        self.elements.append(element)
+        if tag not in VOID_ELEMENTS:
+            self.stack.append(element)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_ELEMENTS:
+            self.stack.pop()
+
+    def handle_data(self, data):
+        if self.stack[-1].tag == 'style':
+            self.styles.append(data)
+            self.style_blocks.append(data)
+        elif self.stack[-1].tag == 'script':
+            self.scripts.append(data)
+
+    def handle_endtag(self, tag):
+        for depth in range(len(self.stack) - 1, 0, -1):
+            if self.stack[depth].tag == tag:
+                del self.stack[depth:]
+                return
+
+class Document:
+    """A parsed page with its elements indexed by id, class and tag"""
+
+    def __init__(self, html_content):
+        parser = DocumentParser()
+        parser.feed(html_content)
+        parser.close()
+        self.root = parser.root
+        self.elements = parser.elements
+        self.style_text = '\n'.join(parser.styles)
+        self.style_blocks = parser.style_blocks
+        self.script_text = '\n'.join(parser.scripts)
+        self.by_id = {}
+        self.by_class = {}
+        self.by_tag = {}
+        for element in self.elements:
+            if 'id' in element.attrs:
+                self.by_id.setdefault(element.attrs['id'], []).append(element)
+            for name in element.classes:
+                self.by_class.setdefault(name, []).append(element)
+            self.by_tag.setdefault(element.tag, []).append(element)
+
+    def candidates(self, compound):
+        """Elements that could match compound, from the most selective index"""
+        if compound.ids:
+            return self.by_id.get(compound.ids[0], [])
+        if compound.classes:
+            return min((self.by_class.get(name, []) for name in compound.classes), key=len)
+        if compound.tag:
+            return self.by_tag.get(compound.tag, [])
+        return self.elements
+
+    def mark_fold(self, sections=FOLD_SECTIONS):
+        """Mark the elements in the first sections page regions, and their ancestors, as above the fold.
+
+        Regions are the outermost section/header/nav/main/... elements; a
+        page without any uses the children of <body>. Returns the marked elements.
+        """
+        regions = [element for element in self.elements if element.tag in FOLD_SECTION_TAGS
+                   and not any(ancestor.tag in FOLD_SECTION_TAGS for ancestor in ancestors(element))]
+        if not regions:
+            body = self.by_tag.get('body')
+            regions = body[0].children if body else self.root.children
+        # Elements are in document order, so everything before the first
+        # region below the fold is above it, ancestors included
+        if len(regions) > sections:
+            fold = self.elements[:self.elements.index(regions[sections])]
+        else:
+            fold = list(self.elements)
+        for element in fold:
+            element.above_fold = True
+        return fold
+
+    def matches(self, selector, above_fold_only=False):
+        """Whether selector matches any element (above the fold, if asked)"""
+        parsed = parse_selector(selector)
+        if parsed is None:
+            # Unsupported syntax: keep the rule
+            return True
+        compounds, combinators = parsed
+        for element in self.candidates(compounds[-1]):
+            if above_fold_only and not element.above_fold:
+                continue
+            if complex_matches(element, compounds, combinators, len(compounds) - 1):
+                return True
+        return False
+
+def specificity(selector):
+    """(ids, classes/attributes/pseudo-classes, types/pseudo-elements) of a selector, or None if unparseable"""
+    ids = classes = types = 0
+    position = 0
+    selector = selector.strip()
+    while position < len(selector):
+        match = SELECTOR_TOKEN_PATTERN.match(selector, position)
+        if not match or match.end() == position:
+            return None
+        position = match.end()
+        if match.group('id') is not None:
+            ids += 1
+        elif match.group('class') is not None or match.group('attribute') is not None:
+            classes += 1
+        elif match.group('tag') is not None and match.group('tag') != '*':
+            types += 1
+        elif match.group('pseudo') is not None:
+            pseudo = match.group('pseudo').lower()
+            if match.group().startswith('::') or pseudo in PSEUDO_ELEMENTS:
+                types += 1
+            elif pseudo != 'where':
+                classes += 1
+    return ids, classes, types
+
+def property_family(name):
+    """'margin' for margin-top, 'border' for -webkit-border-radius; custom properties are their own"""
+    name = name.lower()
+    if name.startswith('--'):
+        return name
+    if name.startswith('-'):
+        name = name.split('-', 2)[2]
+    return name.split('-')[0]
+
+def property_families(name):
+    """Families a declaration of name can set: its own plus those of its longhands"""
+    family = property_family(name)
+    if family == 'all':
+        return {ALL_PROPERTIES}
+    unprefixed = name.lower().split('-', 2)[2] if name.startswith('-') and not name.startswith('--') else name.lower()
+    return {family} | {property_family(longhand) for longhand in SHORTHAND_LONGHANDS.get(unprefixed, ())}
+
+def cascade_signature(rule):
+    """(property families, specificities or None if unknown) a rule takes part in the cascade with"""
+    if rule.children is not None:
+        families = set()
+        specificities = set()
+        for child in rule.children:
+            child_families, child_specificities = cascade_signature(child)
+            families |= child_families
+            if child_specificities is None or specificities is None:
+                specificities = None
+            else:
+                specificities |= child_specificities
+        return families, specificities
+    families = set()
+    for name in PROPERTY_PATTERN.findall(rule.body or ''):
+        families |= property_families(name)
+    if rule.name is not None:
+        return families, {'@' + rule.name}
+    specificities = {specificity(selector) for selector in rule.selectors}
+    return families, None if None in specificities else specificities
+
+def order_matters(first, second):
+    """Whether swapping two rules with these cascade signatures could change a computed style"""
+    if not (first[0] & second[0] or ALL_PROPERTIES in first[0] | second[0]):
+        return False
+    return first[1] is None or second[1] is None or bool(first[1] & second[1])
+
+def ancestors(element):
+    element = element.parent
+    while element is not None:
+        yield element
+        element = element.parent
+
+def referenced_names(rules):
+    """Lowercased text of every declaration block, for @font-face and @keyframes lookups"""
+    parts = []
+    for rule in rules:
+        if rule.children is not None:
+            parts.append(referenced_names(rule.children))
+        elif rule.body is not None and rule.name != 'font-face' and rule.name not in KEYFRAMES_AT_RULES:
+            parts.append(rule.body.lower())
+    return '\n'.join(parts)
+
+def font_family(rule):
+    match = re.search(r'font-family\s*:\s*(["\']?)([^;"\']+)\1', rule.body or '', re.IGNORECASE)
+    return match.group(2).strip().lower() if match else None
+
+def prune_unreferenced(rules, used_text):
+    """Drop @font-face and @keyframes blocks whose family or name never appears in used_text"""
+    kept = []
+    for rule in rules:
+        if rule.children is not None:
+            rule.children = prune_unreferenced(rule.children, used_text)
+        elif rule.name == 'font-face':
+            family = font_family(rule)
+            if family and family not in used_text:
+                continue
+        elif rule.name in KEYFRAMES_AT_RULES:
+            name = rule.prelude.split(None, 1)[1].strip().strip('"\'').lower() if ' ' in rule.prelude else ''
+            if name and not re.search(r'(?<![\w-])%s(?![\w-])' % re.escape(name), used_text):
+                continue
+        kept.append(rule)
+    return kept
+
+def filter_rules(rules, keep_selector):
+    """Keep style rules with at least one selector for which keep_selector is true.
+
+    Grouping at-rules are filtered recursively and dropped when emptied;
+    other at-rules are kept.
+    """
+    kept = []
+    for rule in rules:
+        if rule.children is not None:
+            children = filter_rules(rule.children, keep_selector)
+            if children:
+                kept.append(Rule(rule.prelude, children=children))
+        elif rule.name is not None:
+            kept.append(rule)
+        else:
+            selectors = [selector for selector in rule.selectors if keep_selector(selector)]
+            if selectors:
+                kept.append(Rule(','.join(selectors), rule.body))
+    return kept
+
+def critical_css(rules, document):
+    """Return the CSS text of the rules that apply to elements above the fold of document.
+
+    document must already have had mark_fold() called. @font-face and
+    @keyframes blocks are kept only when the critical rules or the page's
+    own inline styles use them.
+    """
+    rules = filter_rules(rules, lambda selector: document.matches(selector, above_fold_only=True))
+    return serialize(prune_unreferenced(rules, referenced_names(rules) + '\n' + document.style_text.lower()))
+
+class UsedNames:
+    """Tag, id, class and attribute names used anywhere on a set of pages.
+
+    A selector naming anything else cannot match, so purge() drops its
+    rule. Words in script string literals and the safelist count as used,
+    since scripts may add classes at runtime. @font-face and @keyframes
+    blocks are kept when a surviving rule, one of the pages' own <style>
+    blocks, a style attribute or a script string names them.
+    """
+
+    def __init__(self, safelist=()):
+        self.names = set(safelist)
+        self.style_blocks = {}
+        self.style_attributes = set()
+        self.script_words = set(safelist)
+        # Whole literals, so multi-word names such as "Open Sans" are found
+        self.script_strings = {name.lower() for name in safelist}
+        self._text = None
+
+    def add_document(self, document):
+        """Add a page's names, styles and inline scripts; return whether anything was new"""
+        size = self.size()
+        self.names.update(document.by_tag, document.by_id, document.by_class)
+        for element in document.elements:
+            self.names.update(element.attrs)
+            if element.attrs.get('style'):
+                self.style_attributes.add(element.attrs['style'].lower())
+        for css in document.style_blocks:
+            self.style_blocks.setdefault(css, None)
+        self.add_script(document.script_text)
+        return self.size() != size
+
+    def add_script(self, js):
+        """Add a script's string literals and the words in them; return whether any was new"""
+        size = self.size()
+        for match in JS_STRING_PATTERN.finditer(js):
+            literal = match.group()[1:-1]
+            self.script_words.update(NAME_PATTERN.findall(literal))
+            self.script_strings.add(literal.lower())
+        self.names |= self.script_words
+        return self.size() != size
+
+    def size(self):
+        return (len(self.names) + len(self.script_words) + len(self.script_strings) + len(self.style_blocks)
+                + len(self.style_attributes))
+
+    def selector_used(self, selector):
+        parsed = parse_selector(selector)
+        if parsed is None:
+            return True
+        return all((compound.tag is None or compound.tag in self.names)
+                   and all(name in self.names for name in compound.ids + compound.classes)
+                   and all(attribute[0] in self.names for attribute in compound.attributes)
+                   for compound in parsed[0])
+
+    @property
+    def text(self):
+        """Lowercased text searched for font family and animation names"""
+        if self._text is None or self._text[0] != self.size():
+            parts = list(self.style_attributes)
+            parts.extend(sorted(self.script_strings))
+            for css in self.style_blocks:
+                parts.append(referenced_names(filter_rules(parse_stylesheet(css), self.selector_used)))
+            self._text = (self.size(), '\n'.join(parts))
+        return self._text[1]
+
+    def purge(self, rules):
+        """Return the CSS text of rules with unused selectors, fonts and keyframes removed"""
+        rules = filter_rules(rules, self.selector_used)
+        return serialize(prune_unreferenced(rules, referenced_names(rules) + '\n' + self.text))
@@ -1,94 +1,840 @@
 #!/usr/bin/env python3
+import argparse
+import hashlib
+import html
+import io
+import json
 import os
+import random
 import re
+import shutil
+import sys
+import threading
+import time
 import requests
 import urllib.parse
-from pathlib import Path
+from collections import Counter
+from contextlib import redirect_stdout
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
 
-def download_file(url, local_path):
-    """Download a file from URL to local path"""
-    try:
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()
-        
-        # Create directory if it doesn't exist
+from asset_manifest import MANIFEST_NAME, AssetManifest
+from asset_rules import AssetRules, plan_downloads, print_plan
+from download_telemetry import REPORT_NAME, RunTelemetry, print_slowest_hosts
+from update_urls import stream_tokens
+
+# Defaults for the concurrent download engine
+DEFAULT_CONCURRENCY = 16
+DEFAULT_PER_HOST = 4
+
+# Failure handling: (connect, read) timeouts, retries with jittered backoff,
+# and a per-host circuit breaker that trips after consecutive transient failures
+DEFAULT_TIMEOUT = (5, 30)
+DEFAULT_RETRIES = 3
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 10.0
+BREAKER_THRESHOLD = 3
+BREAKER_COOLDOWN = 60.0
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+# Downloads are streamed through <path>.part and renamed into place when complete
+CHUNK_SIZE = 64 * 1024
+PART_SUFFIX = '.part'
+VALIDATOR_SUFFIX = '.part.validator'
+
+# Content-addressed blob store; URL-shaped paths are hardlinks into it
+STORE_NAME = '.store'
+
+# References inside downloaded stylesheets and scripts
+CSS_URL_PATTERN = re.compile(r'url\(\s*["\']?([^"\')\s]+)["\']?\s*\)', re.IGNORECASE)
+CSS_IMPORT_PATTERN = re.compile(r'@import\s+["\']([^"\']+)["\']', re.IGNORECASE)
+JS_URL_PATTERN = re.compile(r'["\'](https?://[^"\'\s<>]+)["\']')
+
+# URL-bearing attributes reported by the HTML extractor
+URL_ATTRIBUTES = {'href', 'src', 'content', 'data-src', 'srcset', 'data-srcset', 'poster', 'data'}
+# Start tags: the name, then attributes quoted or not
+TAG_NAME_PATTERN = re.compile(r'<([a-zA-Z][\w:-]*)')
+TAG_ATTRIBUTE_PATTERN = re.compile(r'\s([^\s"\'>/=]+)(?:\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s"\'>]+)))?')
+
+# The stats dict of the request this thread is making, for TimedConnection
+_request_stats = threading.local()
+
+class TimedConnection:
+    """Mixin recording how long opening the real socket took, in the current request's stats.
+
+    connect covers name resolution and the TCP handshake, tls the TLS
+    handshake after it. Requests on a reused keep-alive connection record
+    neither.
+    """
+
+    def _new_conn(self):
+        start = time.monotonic()
+        sock = super()._new_conn()
+        self.connect_seconds = time.monotonic() - start
+        return sock
+
+    def connect(self):
+        start = time.monotonic()
+        super().connect()
+        stats = getattr(_request_stats, 'stats', None)
+        if stats is not None:
+            stats['connect'] = self.connect_seconds
+            if isinstance(self, HTTPSConnection):
+                stats['tls'] = time.monotonic() - start - self.connect_seconds
+
+class TimedHTTPConnection(TimedConnection, HTTPConnection):
+    pass
+
+class TimedHTTPSConnection(TimedConnection, HTTPSConnection):
+    pass
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+class TimedAdapter(HTTPAdapter):
+    """HTTPAdapter whose connections report their connect and TLS times"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': TimedHTTPConnectionPool,
+                                                   'https': TimedHTTPSConnectionPool}
+
+class HostPool:
+    """Per-host requests sessions, concurrency caps, rate limits and circuit breakers"""
+
+    def __init__(self, per_host=DEFAULT_PER_HOST, rate=None,
+                 breaker_threshold=BREAKER_THRESHOLD, breaker_cooldown=BREAKER_COOLDOWN):
+        self.per_host = per_host
+        self.rate = rate
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._slots = {}
+        self._next_start = {}
+        self._failures = Counter()
+        self._open_until = {}
+        self.trips = Counter()
+
+    def session(self, host):
+        """Return the keep-alive session for a host, creating it on first use"""
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = TimedAdapter(pool_connections=1, pool_maxsize=self.per_host)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._sessions[host] = session
+                self._slots[host] = threading.BoundedSemaphore(self.per_host)
+            return session
+
+    def slot(self, host):
+        """Return the semaphore limiting in-flight requests to a host"""
+        self.session(host)
+        return self._slots[host]
+
+    def throttle(self, host):
+        """Sleep until the host's rate limit (requests per second) allows another request"""
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start.get(host, now))
+            self._next_start[host] = start + 1.0 / self.rate
+        if start > now:
+            time.sleep(start - now)
+
+    def is_open(self, host):
+        """Whether the host's circuit breaker is currently refusing requests"""
+        with self._lock:
+            return time.monotonic() < self._open_until.get(host, 0)
+
+    def record_success(self, host):
+        with self._lock:
+            self._failures[host] = 0
+
+    def record_failure(self, host):
+        """Count a transient failure; returns True if this trips the breaker"""
+        with self._lock:
+            self._failures[host] += 1
+            if self._failures[host] < self.breaker_threshold:
+                return False
+            if time.monotonic() < self._open_until.get(host, 0):
+                return False
+            self._open_until[host] = time.monotonic() + self.breaker_cooldown
+            self.trips[host] += 1
+            return True
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+class IncompleteDownload(IOError):
+    """The connection closed before the advertised Content-Length arrived"""
+
+def is_transient(error):
+    """Whether a download error is worth retrying"""
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code in RETRYABLE_STATUS
+    return isinstance(error, (requests.ConnectionError, requests.Timeout,
+                              requests.exceptions.ChunkedEncodingError, IncompleteDownload))
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_CAP):
+    """Exponential backoff with full jitter for the given retry attempt (0-based)"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+class ContentStore:
+    """SHA-256 keyed blob store that URL-shaped asset paths link into"""
+
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+        self.reused = 0
+        self.reused_bytes = 0
+
+    def blob_path(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    def has(self, digest):
+        return bool(digest) and os.path.exists(self.blob_path(digest))
+
+    def add(self, path, digest):
+        """Move a finished download into the store, dropping it if the blob exists"""
+        blob = self.blob_path(digest)
+        with self._lock:
+            if os.path.exists(blob):
+                self.reused += 1
+                self.reused_bytes += os.path.getsize(path)
+                os.remove(path)
+            else:
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                os.replace(path, blob)
+        return blob
+
+    def materialise(self, digest, local_path):
+        """Point local_path at a blob, as a hardlink where the filesystem allows"""
+        blob = self.blob_path(digest)
+        if os.path.exists(local_path) and os.path.samefile(blob, local_path):
+            return
         os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        tmp_path = f"{local_path}.link"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        try:
+            os.link(blob, tmp_path)
+        except OSError:
+            shutil.copyfile(blob, tmp_path)
+        os.replace(tmp_path, local_path)
+
+    def ingest(self, local_path):
+        """Replace an existing file with a link into the store; returns its digest"""
+        digest = hash_file(local_path).hexdigest()
+        blob = self.blob_path(digest)
+        if not os.path.exists(blob):
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            shutil.copyfile(local_path, blob)
+        elif not os.path.samefile(blob, local_path):
+            self.reused += 1
+            self.reused_bytes += os.path.getsize(local_path)
+        self.materialise(digest, local_path)
+        return digest
+
+def dedupe_tree(base_dir, store):
+    """Fold an existing assets tree into the store so identical files share storage"""
+    for dirpath, dirnames, filenames in os.walk(base_dir):
+        dirnames[:] = [d for d in dirnames if os.path.join(dirpath, d) != store.root]
+        for filename in filenames:
+            if filename.startswith('.') or filename.endswith((PART_SUFFIX, VALIDATOR_SUFFIX)):
+                continue
+            store.ingest(os.path.join(dirpath, filename))
+
+def conditional_headers(entry, local_path):
+    """Build If-None-Match/If-Modified-Since headers for a cached entry"""
+    headers = {}
+    if not entry or not os.path.exists(local_path):
+        return headers
+    if os.path.getsize(local_path) != entry.get('size'):
+        return headers
+    if entry.get('etag'):
+        headers['If-None-Match'] = entry['etag']
+    if entry.get('last_modified'):
+        headers['If-Modified-Since'] = entry['last_modified']
+    return headers
+
+def resume_state(local_path):
+    """Return (offset, validator) for a partial download that can be resumed"""
+    part_path = local_path + PART_SUFFIX
+    validator_path = local_path + VALIDATOR_SUFFIX
+    if not os.path.exists(part_path) or not os.path.exists(validator_path):
+        return 0, None
+    with open(validator_path, 'r', encoding='utf-8') as f:
+        validator = f.read().strip()
+    if not validator:
+        return 0, None
+    return os.path.getsize(part_path), validator
+
+def response_validator(response):
+    """Return a validator suitable for If-Range, preferring a strong ETag"""
+    etag = response.headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return response.headers.get('Last-Modified')
+
+def encoded_body(response):
+    """Whether the body is content-encoded (and decoded by requests while streaming)"""
+    return response.headers.get('Content-Encoding', 'identity').lower() != 'identity'
+
+def hash_file(path, digest=None):
+    """Feed a file into a hashlib digest in chunks"""
+    digest = digest or hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest
+
+def download_file(url, local_path, session=None, manifest=None, store=None,
+                  timeout=DEFAULT_TIMEOUT, raise_errors=False, stats=None):
+    """Stream a file from URL to local path.
+
+    The body is written in chunks to <local_path>.part, which is atomically
+    renamed into place once complete. An interrupted .part file is resumed
+    with a Range request on the next run. With a ContentStore the finished
+    body is kept once per SHA-256 and local_path becomes a link to it.
+
+    Returns 'downloaded', 'not-modified' (304), 'unchanged' (same hash as the
+    file on disk) or 'failed'; with raise_errors the exception is re-raised
+    instead of returning 'failed'. If a stats dict is given it is filled with
+    http_status, ttfb, bytes (transferred) and cache ('hit', 'miss', 'resumed'),
+    plus connect and tls when a HostPool session opened a new connection.
+    """
+    stats = {} if stats is None else stats
+    _request_stats.stats = stats
+    part_path = local_path + PART_SUFFIX
+    validator_path = local_path + VALIDATOR_SUFFIX
+    try:
+        entry = manifest.get(url) if manifest is not None else None
+        if (entry and store is not None and not os.path.exists(local_path)
+                and store.has(entry.get('sha256'))):
+            # We already hold these bytes; restore the path and just revalidate
+            store.materialise(entry['sha256'], local_path)
+        headers = conditional_headers(entry, local_path)
+        offset, validator = resume_state(local_path)
+        if offset:
+            headers['Range'] = f'bytes={offset}-'
+            headers['If-Range'] = validator
+
+        with (session or requests).get(url, headers=headers, timeout=timeout, stream=True) as response:
+            stats['http_status'] = response.status_code
+            stats['ttfb'] = response.elapsed.total_seconds()
+            stats['bytes'] = 0
+            if response.status_code == 304 and ('If-None-Match' in headers or 'If-Modified-Since' in headers):
+                print(f"Not modified: {url}")
+                stats['cache'] = 'hit'
+                return 'not-modified'
+            if response.status_code == 416 and offset:
+                # Our partial file no longer matches the resource; start over
+                os.remove(part_path)
+                os.remove(validator_path)
+                return download_file(url, local_path, session, manifest, store, timeout, raise_errors, stats)
+            response.raise_for_status()
+
+            # Create directory if it doesn't exist
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+
+            digest = hashlib.sha256()
+            if response.status_code == 206:
+                print(f"Resuming {url} at byte {offset}")
+                hash_file(part_path, digest)
+                mode = 'ab'
+                stats['cache'] = 'resumed'
+            else:
+                offset = 0
+                mode = 'wb'
+                stats['cache'] = 'miss'
+                # Content-encoded bodies are decoded as they stream, so their
+                # byte offsets cannot be resumed with a Range request
+                with open(validator_path, 'w', encoding='utf-8') as f:
+                    f.write('' if encoded_body(response) else response_validator(response) or '')
+
+            size = offset
+            with open(part_path, mode) as f:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    f.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+                    stats['bytes'] += len(chunk)
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+            content_type = response.headers.get('Content-Type')
+            expected = response.headers.get('Content-Length')
+            if expected is not None and not encoded_body(response) and offset + int(expected) != size:
+                raise IncompleteDownload(f"incomplete body ({size - offset} of {expected} bytes)")
+
+        digest = digest.hexdigest()
+        if os.path.exists(validator_path):
+            os.remove(validator_path)
+        if manifest is not None:
+            manifest.record(
+                url,
+                path=local_path,
+                etag=etag,
+                last_modified=last_modified,
+                size=size,
+                sha256=digest,
+                content_type=content_type,
+            )
+        if (entry and entry.get('sha256') == digest and os.path.exists(local_path)
+                and os.path.getsize(local_path) == size):
+            os.remove(part_path)
+            print(f"Unchanged: {url}")
+            return 'unchanged'
         
-        # Write file
-        with open(local_path, 'wb') as f:
-            f.write(response.content)
+        if store is not None:
+            store.add(part_path, digest)
+            store.materialise(digest, local_path)
+        else:
+            os.replace(part_path, local_path)
         print(f"Downloaded: {url} -> {local_path}")
-        return True
+        return 'downloaded'
     except Exception as e:
+        if raise_errors:
+            raise
         print(f"Failed to download {url}: {e}")
-        return False
+        return 'failed'
+    finally:
+        _request_stats.stats = None
+
+def download_with_retry(url, local_path, pool, manifest=None, store=None,
+                        retries=DEFAULT_RETRIES, timeout=DEFAULT_TIMEOUT, telemetry=None):
+    """Download through the host pool, retrying transient errors with backoff.
+
+    Returns (status, retries_used, tripped). status is 'skipped' when the
+    host's circuit breaker is open. Each URL is recorded in telemetry when given.
+    """
+    host = urllib.parse.urlparse(url).netloc
+    started = time.monotonic()
+    stats = {}
+
+    def finish(status, attempt):
+        if telemetry is not None:
+            telemetry.record(url, host, status=status, retries=attempt,
+                             total=time.monotonic() - started, **stats)
+        return status, attempt, tripped
+
+    tripped = False
+    for attempt in range(retries + 1):
+        if pool.is_open(host):
+            print(f"Skipped (circuit open for {host}): {url}")
+            return finish('skipped', attempt)
+        try:
+            stats = {}
+            with pool.slot(host):
+                pool.throttle(host)
+                status = download_file(url, local_path, pool.session(host), manifest, store,
+                                       timeout, raise_errors=True, stats=stats)
+            pool.record_success(host)
+            if status == 'unchanged':
+                stats['cache'] = 'hit'
+            return finish(status, attempt)
+        except Exception as e:
+            stats['error'] = str(e)
+            if not is_transient(e):
+                print(f"Failed to download {url}: {e}")
+                return finish('failed', attempt)
+            if pool.record_failure(host):
+                tripped = True
+                print(f"Circuit breaker tripped for {host}")
+            if attempt == retries:
+                print(f"Failed to download {url} after {attempt + 1} attempts: {e}")
+                return finish('failed', attempt)
+            delay = backoff_delay(attempt)
+            print(f"Retrying {url} in {delay:.1f}s: {e}")
+            time.sleep(delay)
+
+def download_all(urls, base_dir="assets", concurrency=DEFAULT_CONCURRENCY, per_host=DEFAULT_PER_HOST,
+                 manifest=None, store=None, max_depth=0, rules=None,
+                 retries=DEFAULT_RETRIES, timeout=DEFAULT_TIMEOUT, rate=None, telemetry=None):
+    """Download URLs concurrently, reusing one connection pool per host.
+
+    With max_depth > 0 this is a breadth-first crawl: every CSS, JS or HTML
+    resource is parsed as soon as it lands and the URLs it references are
+    queued one level deeper, up to max_depth. Discovered URLs must pass
+    rules (an AssetRules) when that is given.
+
+    Transient errors are retried with jittered backoff, each host is limited
+    to `rate` requests per second when given, and a host whose circuit breaker
+    has tripped is skipped.
+
+    Local paths come from the manifest, which resolves path collisions
+    deterministically and is saved when the run ends.
+
+    Returns a Counter of download statuses plus 'discovered', 'retries' and
+    'breaker-trips' counts and a per-host 'trips:<host>' entry.
+    """
+    pool = HostPool(per_host, rate)
+
+    if manifest is None:
+        manifest = AssetManifest()
+
+    def fetch(url, local_path):
+        status, retried, tripped = download_with_retry(url, local_path, pool, manifest, store,
+                                                       retries, timeout, telemetry)
+        return status, local_path, retried
+
+    results = Counter()
+    seen = set(urls)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            pending = {executor.submit(fetch, url, manifest.assign(url, base_dir)): (url, 0)
+                       for url in sorted(urls)}
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    url, depth = pending.pop(future)
+                    status, local_path, retried = future.result()
+                    results[status] += 1
+                    results['retries'] += retried
+                    if status in ('failed', 'skipped') or depth >= max_depth:
+                        continue
+                    references = discover_urls(url, local_path)
+                    if rules is not None:
+                        found_urls = plan_downloads(references, rules)[0]
+                    else:
+                        found_urls = {found for found, tag, attribute, attrs in references}
+                    for found in sorted(found_urls - seen):
+                        seen.add(found)
+                        results['discovered'] += 1
+                        local_path = manifest.assign(found, base_dir)
+                        pending[executor.submit(fetch, found, local_path)] = (found, depth + 1)
+    finally:
+        pool.close()
+        manifest.save()
+        if telemetry is not None:
+            telemetry.finish()
+    results['breaker-trips'] = sum(pool.trips.values())
+    for host, count in pool.trips.items():
+        results[f'trips:{host}'] = count
+    return results
+
+def head_url(url, pool, manifest, timeout=DEFAULT_TIMEOUT):
+    """HEAD one URL and describe what mirroring it would transfer"""
+    host = urllib.parse.urlparse(url).netloc
+    entry = manifest.get(url) or {}
+    local_path = entry.get('path')
+    cached = bool(local_path and os.path.exists(local_path) and os.path.getsize(local_path) == entry.get('size'))
+    info = {'url': url, 'host': host, 'cached': cached, 'fresh': False,
+            'status': None, 'content_type': None, 'bytes': None}
+    if pool.is_open(host):
+        info['error'] = 'circuit open'
+        return info
+    headers = conditional_headers(entry, local_path) if cached else {}
+    try:
+        with pool.slot(host):
+            pool.throttle(host)
+            response = pool.session(host).head(url, headers=headers, timeout=timeout, allow_redirects=True)
+        pool.record_success(host)
+    except Exception as e:
+        if is_transient(e):
+            pool.record_failure(host)
+        info['error'] = str(e)
+        return info
+    info['status'] = response.status_code
+    content_type = response.headers.get('Content-Type') or entry.get('content_type') or ''
+    info['content_type'] = content_type.split(';')[0].strip() or None
+    length = response.headers.get('Content-Length')
+    if response.status_code == 304:
+        info['fresh'] = True
+        info['bytes'] = entry.get('size')
+    elif 200 <= response.status_code < 300 and length is not None and length.isdigit():
+        # Error pages have lengths too, but nothing of theirs would be mirrored
+        info['bytes'] = int(length)
+    if cached and not info['fresh'] and response.ok:
+        etag = response.headers.get('ETag')
+        info['fresh'] = bool(etag and etag == entry.get('etag'))
+    return info
+
+def plan_mirror(urls, manifest, concurrency=DEFAULT_CONCURRENCY, per_host=DEFAULT_PER_HOST,
+                timeout=DEFAULT_TIMEOUT, rate=None):
+    """Dry run: HEAD every URL in parallel and summarise the transfer a mirror needs.
+
+    Returns a JSON-serialisable dict with per-URL details, per-host totals
+    and overall totals. 'transfer_bytes' counts URLs that are not cached and
+    fresh; URLs whose size a 2xx/304 response does not report are counted
+    under 'unknown_size', and failed URLs count towards neither.
+    """
+    pool = HostPool(per_host, rate)
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            details = list(executor.map(lambda url: head_url(url, pool, manifest, timeout), sorted(urls)))
+    finally:
+        pool.close()
+
+    def empty_totals():
+        return {'urls': 0, 'bytes': 0, 'transfer_bytes': 0, 'cached': 0, 'fresh': 0,
+                'unknown_size': 0, 'errors': 0, 'content_types': Counter()}
+
+    hosts = {}
+    total = empty_totals()
+    for info in details:
+        for totals in (hosts.setdefault(info['host'], empty_totals()), total):
+            totals['urls'] += 1
+            totals['cached'] += info['cached']
+            totals['fresh'] += info['fresh']
+            failed = 'error' in info or (info['status'] or 0) >= 400
+            totals['errors'] += failed
+            totals['content_types'][info['content_type'] or 'unknown'] += 1
+            if failed:
+                continue
+            if info['bytes'] is None:
+                totals['unknown_size'] += 1
+                continue
+            totals['bytes'] += info['bytes']
+            if not (info['cached'] and info['fresh']):
+                totals['transfer_bytes'] += info['bytes']
+    for totals in list(hosts.values()) + [total]:
+        totals['content_types'] = dict(totals['content_types'].most_common())
+    return {'urls': details, 'hosts': dict(sorted(hosts.items())), 'total': total}
+
+def extract_urls_from_css(css_content, base_url):
+    """Extract url() and @import references from CSS, resolved against base_url"""
+    urls = set()
+    for pattern in (CSS_URL_PATTERN, CSS_IMPORT_PATTERN):
+        for match in pattern.findall(css_content):
+            if match.startswith(('data:', '#')):
+                continue
+            urls.add(urllib.parse.urljoin(base_url, match))
+    return {url for url in urls if url.startswith('http')}
+
+def extract_urls_from_js(js_content):
+    """Extract absolute URLs from string literals in JavaScript"""
+    return set(JS_URL_PATTERN.findall(js_content))
+
+def discover_urls(url, local_path):
+    """Parse a downloaded resource and return (url, tag, attribute, attrs) references"""
+    extension = os.path.splitext(local_path)[1].lower()
+    if extension not in ('.css', '.js', '.html', '.htm'):
+        return []
+    try:
+        with open(local_path, 'r', encoding='utf-8', errors='replace') as f:
+            if extension == '.css':
+                references = [(found, None, 'url()', {}) for found in extract_urls_from_css(f.read(), url)]
+            elif extension == '.js':
+                references = [(found, None, 'js-string', {}) for found in extract_urls_from_js(f.read())]
+            else:
+                references = list(iter_references(f))
+    except OSError:
+        return []
+    return [(urllib.parse.urldefrag(found)[0], tag, attribute, attrs)
+            for found, tag, attribute, attrs in references]
+
+def tag_context(tag):
+    """Attribute dict of a start tag: lowercased names, character references decoded"""
+    context = {}
+    for name, double_quoted, single_quoted, unquoted in TAG_ATTRIBUTE_PATTERN.findall(tag):
+        value = double_quoted or single_quoted or unquoted
+        context.setdefault(name.lower(), html.unescape(value) if '&' in value else value)
+    return context
+
+def css_references(css, tag, context):
+    """(url, tag, attribute, context) for url() and @import references in CSS"""
+    return [(url, tag, attribute, context)
+            for attribute, pattern in (('url()', CSS_URL_PATTERN), ('@import', CSS_IMPORT_PATTERN))
+            for url in pattern.findall(css) if url.startswith('http')]
+
+def tag_references(tag, context):
+    """(url, tag, attribute, context) for the external URLs in a start tag's attributes"""
+    references = []
+    for attribute, value in context.items():
+        if attribute not in URL_ATTRIBUTES or not value:
+            continue
+        if attribute.endswith('srcset'):
+            candidates = [part.split()[0] for part in value.split(',') if part.strip()]
+        else:
+            candidates = [value.strip()]
+        references += [(url, tag, attribute, context) for url in candidates if url.startswith('http')]
+    style = context.get('style')
+    if style and 'url(' in style.lower():
+        references += css_references(style, tag, context)
+    return references
+
+def iter_references(source, chunk_size=CHUNK_SIZE):
+    """Yield (url, tag, attribute, context) for every external URL in an HTML file object.
+
+    context is the element's attribute dict, so rules can look at link rel
+    and meta name/property. The document is tokenized in one regex pass as
+    it is read (see update_urls.stream_tokens), holding only the current
+    chunk. Comments and <script> bodies are never scanned, srcset lists are
+    split into their candidates, and url()/@import in <style> blocks and
+    style attributes are reported with attribute 'url()' or '@import'.
+    """
+    unterminated = None
+    for text, match in stream_tokens(source, chunk_size):
+        if unterminated is not None:
+            # An unclosed <script>/<style> runs to the end of the document
+            unterminated[2].append(text + (match.group() if match else ''))
+            continue
+        if match is None:
+            continue
+        token = match.group()
+        if token.startswith('<!--'):
+            continue
+        raw_tag = match.group(1)
+        open_tag = token if raw_tag is None else token[:match.start(3) - match.start()]
+        name = TAG_NAME_PATTERN.match(open_tag).group(1).lower()
+        # Only absolute URLs are reported, so most tags need no attribute parsing
+        context = tag_context(open_tag) if 'http' in open_tag or name == 'style' else {}
+        if 'http' in open_tag:
+            yield from tag_references(name, context)
+        if raw_tag is None and name in ('script', 'style'):
+            unterminated = (name, context, [])
+        elif raw_tag is not None and name == 'style':
+            yield from css_references(match.group(3), name, context)
+    if unterminated is not None and unterminated[0] == 'style':
+        yield from css_references(''.join(unterminated[2]), 'style', unterminated[1])
+
+def extract_references_from_html(html_content):
+    """Extract (url, tag, attribute, context) for every external URL in HTML content"""
+    return list(iter_references(io.StringIO(html_content)))
 
 def extract_urls_from_html(html_content):
     """Extract all external URLs from HTML content"""
-    urls = set()
-    
-    # Find all URLs in various attributes
-    patterns = [
-        r'href=["\']([^"\']+)["\']',
-        r'src=["\']([^"\']+)["\']',
-        r'url\(["\']?([^"\')\s]+)["\']?\)',
-        r'content=["\']([^"\']+)["\']',
-        r'data-src=["\']([^"\']+)["\']',
-    ]
-    
-    for pattern in patterns:
-        matches = re.findall(pattern, html_content, re.IGNORECASE)
-        for match in matches:
-            if match.startswith('http'):
-                urls.add(match)
-    
-    return urls
+    return {url for url, tag, attribute, attrs in extract_references_from_html(html_content)}
 
-def create_local_path(url, base_dir="assets"):
-    """Create a local file path for a URL"""
-    parsed = urllib.parse.urlparse(url)
-    
-    # Create a safe filename from the URL
-    path_parts = parsed.netloc.split('.')
-    if len(path_parts) > 2:
-        # For subdomains, use the main domain
-        domain = '.'.join(path_parts[-2:])
-    else:
-        domain = parsed.netloc
+def parse_args():
+    parser = argparse.ArgumentParser(description="Download external assets referenced by an HTML page")
+    parser.add_argument('input', nargs='?', default='niw_full.html', help="HTML file to scan for URLs")
+    parser.add_argument('--base-dir', default='assets', help="Directory to mirror assets into")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help="Maximum number of downloads in flight")
+    parser.add_argument('--per-host', type=int, default=DEFAULT_PER_HOST,
+                        help="Maximum number of concurrent connections per host")
+    parser.add_argument('--manifest', help=f"URL/path manifest (default: <base-dir>/{MANIFEST_NAME})")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Start a fresh manifest and download everything again")
+    parser.add_argument('--no-store', action='store_true',
+                        help=f"Write plain files instead of linking into <base-dir>/{STORE_NAME}")
+    parser.add_argument('--dedupe', action='store_true',
+                        help="Fold files already under --base-dir into the content store first")
+    parser.add_argument('--depth', type=int, default=0,
+                        help="Follow references found in downloaded CSS/JS/HTML this many levels deep")
+    parser.add_argument('--allow-host', action='append', dest='allow_hosts',
+                        help="Only download from this host or its subdomains (repeatable)")
+    parser.add_argument('--deny-host', action='append', dest='deny_hosts',
+                        help="Never download from this host or its subdomains (repeatable)")
+    parser.add_argument('--deny-path', action='append', dest='deny_paths',
+                        help="Never download URLs whose path matches this regex (repeatable)")
+    parser.add_argument('--rules', help="JSON file with allow_hosts/deny_hosts/allow_paths/deny_paths")
+    parser.add_argument('--no-filter', action='store_true',
+                        help="Download every referenced URL, including trackers and links")
+    parser.add_argument('--verbose-plan', action='store_true', help="List every skipped URL")
+    parser.add_argument('--report', help=f"Run telemetry JSON (default: <base-dir>/{REPORT_NAME})")
+    parser.add_argument('--plan', nargs='?', const='-', metavar='FILE',
+                        help="Dry run: HEAD every URL and write a JSON size/cache report (default stdout)")
+    parser.add_argument('--retries', type=int, default=DEFAULT_RETRIES,
+                        help="Retries for transient errors (timeouts, resets, 429/5xx)")
+    parser.add_argument('--connect-timeout', type=float, default=DEFAULT_TIMEOUT[0],
+                        help="Seconds to wait for a connection")
+    parser.add_argument('--read-timeout', type=float, default=DEFAULT_TIMEOUT[1],
+                        help="Seconds to wait between bytes of a response")
+    parser.add_argument('--rate', type=float,
+                        help="Maximum requests per second to any single host")
+    return parser.parse_args()
+
+def prepare_run(args):
+    """Read the page, apply the filter rules and load the manifest"""
+    # Tokenize the HTML file as it is read, collecting URLs with their context
+    with open(args.input, 'r', encoding='utf-8') as f:
+        references = list(iter_references(f))
     
-    # Get the path and filename
-    path = parsed.path
-    if not path or path == '/':
-        path = '/index.html'
+    print(f"Found {len({url for url, tag, attribute, attrs in references})} external URLs")
     
-    # Create local path
-    local_path = os.path.join(base_dir, domain, path.lstrip('/'))
+    # Keep only real page assets and report the plan before downloading
+    rules = None
+    if args.no_filter:
+        urls = {url for url, tag, attribute, attrs in references}
+    else:
+        rules = AssetRules.from_file(args.rules) if args.rules else AssetRules()
+        rules.allow_hosts += args.allow_hosts or []
+        rules.deny_hosts += args.deny_hosts or []
+        rules.deny_paths += [re.compile(p) for p in args.deny_paths or []]
+        urls, skipped, reasons = plan_downloads(references, rules)
+        print_plan(urls, skipped, reasons, args.verbose_plan)
     
-    # Ensure we have a filename
-    if not os.path.basename(local_path):
-        local_path = os.path.join(local_path, 'index.html')
+    # URL -> path assignments, validators and hashes shared with update_urls.py
+    manifest = AssetManifest(args.manifest or os.path.join(args.base_dir, MANIFEST_NAME),
+                             load=not args.no_cache)
     
-    return local_path
+    return urls, rules, manifest
 
 def main():
-    # Read the HTML file
-    with open('niw_full.html', 'r', encoding='utf-8') as f:
-        html_content = f.read()
+    args = parse_args()
+
+    if args.plan == '-':
+        # Keep stdout clean for the JSON report
+        with redirect_stdout(sys.stderr):
+            urls, rules, manifest = prepare_run(args)
+    else:
+        urls, rules, manifest = prepare_run(args)
+
+    if args.plan:
+        report = plan_mirror(urls, manifest, args.concurrency, args.per_host,
+                             (args.connect_timeout, args.read_timeout), args.rate)
+        if args.plan == '-':
+            json.dump(report, sys.stdout, indent=2)
+            print()
+        else:
+            with open(args.plan, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+            total = report['total']
+            print(f"Plan written to {args.plan}: {total['urls']} URLs, {total['bytes']} bytes, "
+                  f"{total['transfer_bytes']} to transfer, {total['unknown_size']} of unknown size")
+        return
     
-    # Extract all URLs
-    urls = extract_urls_from_html(html_content)
+    store = None
+    if not args.no_store:
+        store = ContentStore(os.path.join(args.base_dir, STORE_NAME))
+        if args.dedupe:
+            dedupe_tree(args.base_dir, store)
     
-    print(f"Found {len(urls)} external URLs")
+    # Download concurrently with pooled connections
+    telemetry = RunTelemetry()
+    results = download_all(urls, args.base_dir, args.concurrency, args.per_host, manifest, store,
+                           args.depth, rules, args.retries,
+                           (args.connect_timeout, args.read_timeout), args.rate, telemetry)
     
-    # Download each file
-    downloaded_count = 0
-    for url in urls:
-        local_path = create_local_path(url)
-        if download_file(url, local_path):
-            downloaded_count += 1
+    if args.depth:
+        print(f"Discovered {results['discovered']} more URLs in downloaded resources")
+    print(f"Successfully downloaded {results['downloaded']} files")
+    print(f"Revalidated {results['not-modified'] + results['unchanged']} unchanged files "
+          f"({results['not-modified']} not modified, {results['unchanged']} same hash)")
+    if store is not None and store.reused:
+        print(f"Deduplicated {store.reused} files ({store.reused_bytes} bytes) via {store.root}")
+    if results['retries']:
+        print(f"Retried {results['retries']} times")
+    if results['breaker-trips']:
+        hosts = sorted(key.split(':', 1)[1] for key in results if key.startswith('trips:'))
+        print(f"Circuit breaker tripped {results['breaker-trips']} times ({', '.join(hosts)}); "
+              f"skipped {results['skipped']} URLs")
+    if results['failed']:
+        print(f"Failed: {results['failed']}")
     
-    print(f"Successfully downloaded {downloaded_count} files")
+    report_path = args.report or os.path.join(args.base_dir, REPORT_NAME)
+    report = telemetry.write(report_path)
+    run = report['run']
+    if run['wall_throughput_bps'] is not None:
+        print(f"Fetched {run['bytes']} bytes in {run['wall_seconds']:.1f}s "
+              f"({run['wall_throughput_bps'] / 1024:.0f} KiB/s); report written to {report_path}")
+    print("Slowest hosts by median TTFB:")
+    print_slowest_hosts(report)
 
 if __name__ == "__main__":
     main()
-
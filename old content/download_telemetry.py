@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Per-URL timing and throughput telemetry for download_assets.py runs,
+aggregated per host and for the whole run and written as JSON.
+"""
+
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+REPORT_NAME = '.download_report.json'
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers, or None if empty"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def rounded(value, digits=4):
+    return None if value is None else round(value, digits)
+
+class RunTelemetry:
+    """Thread-safe collector of per-URL download measurements.
+
+    Each record holds url, host, status, http_status, bytes, retries, cache
+    ('hit', 'miss' or 'resumed') and timings in seconds: connect (name
+    resolution plus TCP handshake) and tls (TLS handshake), both timed on the
+    socket and present only when the request opened a new connection; ttfb
+    (request sent to headers received, including any such connection setup)
+    and total (including retries and backoff).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.records = []
+        self.started = time.time()
+        self._clock = time.monotonic()
+        self.finished = None
+
+    def record(self, url, host, **fields):
+        with self._lock:
+            self.records.append(dict(url=url, host=host, **fields))
+
+    def finish(self):
+        self.finished = time.monotonic()
+
+    def summarise(self, records):
+        """Aggregate a list of records into counts, bytes and throughput"""
+        ttfbs = [r['ttfb'] for r in records if r.get('ttfb') is not None]
+        connects = [r['connect'] for r in records if r.get('connect') is not None]
+        handshakes = [r['tls'] for r in records if r.get('tls') is not None]
+        transfer_time = sum(r.get('total') or 0 for r in records if r.get('bytes'))
+        total_bytes = sum(r.get('bytes') or 0 for r in records)
+        return {
+            'requests': len(records),
+            'bytes': total_bytes,
+            'retries': sum(r.get('retries') or 0 for r in records),
+            'failures': sum(r.get('status') in ('failed', 'skipped') for r in records),
+            'cache_hits': sum(r.get('cache') == 'hit' for r in records),
+            'cache_misses': sum(r.get('cache') in ('miss', 'resumed') for r in records),
+            'ttfb_p50': rounded(percentile(ttfbs, 0.5)),
+            'ttfb_p90': rounded(percentile(ttfbs, 0.9)),
+            'ttfb_max': rounded(max(ttfbs) if ttfbs else None),
+            'connections': len(connects),
+            'connect_p50': rounded(percentile(connects, 0.5)),
+            'tls_p50': rounded(percentile(handshakes, 0.5)),
+            'seconds': rounded(sum(r.get('total') or 0 for r in records)),
+            # Bytes per second of time spent on requests that transferred a body
+            'throughput_bps': round(total_bytes / transfer_time) if transfer_time else None,
+        }
+
+    def report(self):
+        """Build the JSON-serialisable run report"""
+        with self._lock:
+            records = sorted(self.records, key=lambda r: r['url'])
+        wall = (self.finished or time.monotonic()) - self._clock
+        by_host = {}
+        for record in records:
+            by_host.setdefault(record['host'], []).append(record)
+        hosts = {}
+        for host, host_records in sorted(by_host.items()):
+            hosts[host] = self.summarise(host_records)
+        run = self.summarise(records)
+        run['wall_seconds'] = rounded(wall)
+        run['wall_throughput_bps'] = round(run['bytes'] / wall) if wall > 0 else None
+        return {
+            'started': datetime.fromtimestamp(self.started, timezone.utc).isoformat(),
+            'run': run,
+            'hosts': hosts,
+            'urls': [{key: rounded(value) if isinstance(value, float) else value
+                      for key, value in record.items()} for record in records],
+        }
+
+    def write(self, path):
+        """Write the report to path and return it"""
+        report = self.report()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        return report
+
+def print_slowest_hosts(report, limit=5):
+    """Print the hosts with the worst median time to first byte"""
+    hosts = [(stats['ttfb_p50'], host, stats) for host, stats in report['hosts'].items()
+             if stats['ttfb_p50'] is not None]
+    for ttfb, host, stats in sorted(hosts, reverse=True)[:limit]:
+        throughput = stats['throughput_bps']
+        rate = f"{throughput / 1024:.0f} KiB/s" if throughput else "n/a"
+        print(f"  {host}: {stats['requests']} requests, {stats['bytes']} bytes, "
+              f"TTFB p50 {ttfb * 1000:.0f} ms, {rate}")
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Hoist the inline <style> and <script> code that every page repeats into
+shared external files, so a visitor moving between index.html and the book
+pages downloads it once and then serves it from cache.
+
+Style blocks are compared rule by rule, since each page's export only
+differs in a few rules. A rule of an unconditional <style> common to every
+page moves to static/shared.<hash>.css, linked just before the page's first
+such block, unless some rule left inline (or a stylesheet linked after that
+point) could then override it differently (same property family, counting
+shorthands, and specificity). Runs of identical inline scripts, separated
+only by comments, <noscript> or async/defer scripts, move to one
+static/shared.<hash>.js per script, so an error in one still leaves the
+others running; scripts too small to be worth a request of their own stay
+inline.
+
+    python3 hoist_shared.py index.html book.html bookv2.html book_down.html
+"""
+
+import argparse
+import difflib
+import hashlib
+import os
+import posixpath
+import re
+
+from asset_inliner import FINGERPRINT_DIR, STYLE_URL_PATTERN, rebase_page, rebase_url
+from css_rules import ALL_PROPERTIES, cascade_signature, order_matters, parse_stylesheet, serialize
+
+# Inline blocks; external scripts match too and are skipped
+INLINE_BLOCK_PATTERN = re.compile(r'<(style|script)\b([^>]*)>(.*?)</\1\s*>', re.DOTALL | re.IGNORECASE)
+ATTRIBUTE_PATTERN = re.compile(r'([^\s=/>]+)(?:\s*=\s*("[^"]*"|\'[^\']*\'|[^\s>]+))?')
+SCRIPT_TYPES = ('', 'text/javascript', 'application/javascript')
+LINK_TAG_PATTERN = re.compile(r'<link\b[^>]*>', re.IGNORECASE)
+# A linked stylesheet's rules are unknown, so nothing may be hoisted past one
+LINKED_STYLESHEET = (None, False)
+LINKED_SIGNATURE = ({ALL_PROPERTIES}, None)
+# What may sit between two scripts of one run without running in between them
+RUN_SEPARATOR_PATTERN = re.compile(
+    r'(?:\s+|<!--.*?-->|<noscript\b.*?</noscript\s*>'
+    r'|<script\b[^>]*\s(?:async|defer)\b[^>]*>\s*</script\s*>)*',
+    re.DOTALL | re.IGNORECASE
+)
+
+SHARED_DIR = FINGERPRINT_DIR
+SHARED_STYLESHEET = '<link rel="stylesheet" href="{href}">\n'
+SHARED_SCRIPT = '<script src="{href}"></script>'
+HASH_LENGTH = 8
+# Smaller scripts cost more as an extra request than they save by caching
+MIN_SHARED_SCRIPT = 1024
+OUTPUT_SUFFIX = '_hoisted.html'
+
+def parse_attributes(text):
+    return {name.lower(): (value or '').strip('"\'') for name, value in ATTRIBUTE_PATTERN.findall(text)}
+
+def digest(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def inline_blocks(html_content):
+    """(kind, element match) for each inline stylesheet and classic inline script"""
+    blocks = []
+    for match in INLINE_BLOCK_PATTERN.finditer(html_content):
+        kind = match.group(1).lower()
+        attrs = parse_attributes(match.group(2))
+        if kind == 'script' and ('src' in attrs or attrs.get('type', '').lower() not in SCRIPT_TYPES):
+            continue
+        blocks.append((kind, match))
+    return blocks
+
+def unconditional(match):
+    """Whether a <style> block applies to every medium, so its rules can move to a plain <link>"""
+    return parse_attributes(match.group(2)).get('media', 'all').strip().lower() in ('', 'all')
+
+def script_runs(html_content):
+    """Lists of inline script matches that run back to back"""
+    runs = []
+    previous = None
+    for kind, match in inline_blocks(html_content):
+        if kind != 'script':
+            continue
+        if previous and RUN_SEPARATOR_PATTERN.fullmatch(html_content, previous.end(), match.start()):
+            runs[-1].append(match)
+        else:
+            runs.append([match])
+        previous = match
+    return runs
+
+def page_rules(html_content):
+    """The rules of the page's <style> blocks in order, as (block match, Rule)"""
+    return [(match, rule) for kind, match in inline_blocks(html_content) if kind == 'style'
+            for rule in parse_stylesheet(match.group(3))]
+
+def cascade_entries(html_content):
+    """(rule text, hoistable) for the page's <style> rules in cascade order.
+
+    Stylesheets linked after the first unconditional block, where hoisted
+    rules end up, appear as LINKED_STYLESHEET.
+    """
+    styles = [match for kind, match in inline_blocks(html_content) if kind == 'style']
+    shared_at = next((match.start() for match in styles if unconditional(match)), None)
+    positioned = [(match.start(), [(rule.css(), unconditional(match)) for rule in parse_stylesheet(match.group(3))])
+                  for match in styles]
+    if shared_at is not None:
+        positioned += [(match.start(), [LINKED_STYLESHEET]) for match in LINK_TAG_PATTERN.finditer(html_content)
+                       if match.start() > shared_at
+                       and 'stylesheet' in parse_attributes(match.group()).get('rel', '').lower().split()]
+    positioned.sort(key=lambda item: item[0])
+    return [entry for position, entries in positioned for entry in entries]
+
+def common_subsequence(first, second):
+    matcher = difflib.SequenceMatcher(None, first, second, autojunk=False)
+    return [item for block in matcher.get_matching_blocks() for item in first[block.a:block.a + block.size]]
+
+def shared_rules(pages):
+    """CSS texts of the rules to hoist, in cascade order"""
+    sequences = []
+    for html_content in pages.values():
+        # Rules of media-conditional blocks stay but still take part in the cascade
+        entries = cascade_entries(html_content)
+        counts = {}
+        for text, hoistable in entries:
+            if hoistable:
+                counts[text] = counts.get(text, 0) + 1
+        sequences.append((entries, counts))
+    # Rules that occur exactly once on every page, in an order all pages agree on
+    candidates = [text for text, hoistable in sequences[0][0]
+                  if hoistable and all(counts.get(text) == 1 for entries, counts in sequences)]
+    for entries, counts in sequences[1:]:
+        present = set(candidates)
+        candidates = common_subsequence(candidates, [text for text, hoistable in entries
+                                                     if hoistable and text in present])
+
+    # Hoisted rules move ahead of every rule left inline; drop any whose
+    # relative order with an earlier inline rule could matter, until stable
+    signatures = {LINKED_STYLESHEET[0]: LINKED_SIGNATURE}
+    for html_content in pages.values():
+        for match, rule in page_rules(html_content):
+            signatures.setdefault(rule.css(), cascade_signature(rule))
+    hoisted = set(candidates)
+    changed = True
+    while changed:
+        changed = False
+        for entries, counts in sequences:
+            inline = []
+            for text, hoistable in entries:
+                if not hoistable or text not in hoisted:
+                    inline.append(signatures[text])
+                elif any(order_matters(signature, signatures[text]) for signature in inline):
+                    hoisted.discard(text)
+                    inline.append(signatures[text])
+                    changed = True
+    return [text for text in candidates if text in hoisted]
+
+def shared_script_runs(pages):
+    """Script runs, as tuples of content digests, that every page contains"""
+    page_runs = [{tuple(digest(match.group(3)) for match in run) for run in script_runs(html_content)}
+                 for html_content in pages.values()]
+    return sorted(set.intersection(*page_runs)) if page_runs else []
+
+def plan_hoisting(pages, shared_dir=SHARED_DIR):
+    """Work out what to hoist from {name: html}; returns a picklable plan with the shared files' contents.
+
+    plan['runs'] maps each shared script run to its files, one per script,
+    with None for scripts under MIN_SHARED_SCRIPT bytes that stay inline.
+    Script runs that only some pages contain, and pages given alone, hoist nothing.
+    """
+    plan = {'rules': [], 'runs': {}, 'files': {}}
+    if len(pages) < 2:
+        return plan
+    plan['rules'] = shared_rules(pages)
+    if plan['rules']:
+        css = ''.join(plan['rules'])
+        name = posixpath.join(shared_dir, f"shared.{digest(css)[:HASH_LENGTH]}.css")
+        plan['files'][name] = css
+    first = next(iter(pages.values()))
+    scripts = {digest(match.group(3)): match.group(3) for run in script_runs(first) for match in run}
+    for run in shared_script_runs(pages):
+        names = []
+        for key in run:
+            if len(scripts[key].encode('utf-8')) < MIN_SHARED_SCRIPT:
+                names.append(None)
+                continue
+            name = posixpath.join(shared_dir, f"shared.{key[:HASH_LENGTH]}.js")
+            plan['files'][name] = scripts[key]
+            names.append(name)
+        if any(names):
+            plan['runs'][run] = tuple(names)
+    return plan
+
+def hoist(html_content, plan):
+    """Return the page with the planned rules and script runs replaced by references to the shared files"""
+    edits = []
+    hoisted = set(plan['rules'])
+    css_name = next((name for name in plan['files'] if name.endswith('.css')), None)
+    if hoisted:
+        linked = False
+        for kind, match in inline_blocks(html_content):
+            if kind != 'style' or not unconditional(match):
+                continue
+            rules = parse_stylesheet(match.group(3))
+            kept = [rule for rule in rules if rule.css() not in hoisted]
+            link = '' if linked else SHARED_STYLESHEET.format(href=css_name)
+            linked = True
+            if len(kept) == len(rules):
+                if link:
+                    edits.append((match.start(), match.start(), link))
+            elif kept:
+                edits.append((match.start(), match.start(), link))
+                edits.append((match.start(3), match.end(3), serialize(kept)))
+            else:
+                edits.append((match.start(), match.end(), link))
+    for run in script_runs(html_content):
+        names = plan['runs'].get(tuple(digest(match.group(3)) for match in run))
+        if names:
+            edits += [(match.start(), match.end(), SHARED_SCRIPT.format(href=name))
+                      for match, name in zip(run, names) if name]
+    edits.sort(key=lambda edit: (edit[0], edit[1]))
+
+    parts = []
+    position = 0
+    for start, end, text in edits:
+        parts.append(html_content[position:start])
+        parts.append(text)
+        position = end
+    parts.append(html_content[position:])
+    return ''.join(parts)
+
+def write_shared_files(plan, output_dir='.'):
+    """Write the plan's shared files under output_dir; return their paths.
+
+    url()s in the hoisted CSS are relative to the site root, where the
+    pages are, and are rebased to the shared file's directory.
+    """
+    paths = []
+    for name, content in plan['files'].items():
+        path = os.path.join(output_dir, name)
+        if name.endswith('.css'):
+            target = posixpath.dirname(posixpath.join(output_dir, name))
+            content = STYLE_URL_PATTERN.sub(
+                lambda match: match.group().replace(match.group(1), rebase_url(match.group(1), '', target), 1),
+                content)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        paths.append(path)
+    return paths
+
+def print_plan(plan, pages):
+    """Report what hoisting moves out of each page"""
+    if not plan['files']:
+        print("Nothing is shared by every page; no blocks hoisted.")
+        return
+    for name, content in plan['files'].items():
+        print(f"Shared {name}: {len(content.encode('utf-8'))} bytes, once instead of in each of {len(pages)} pages")
+    scripts = sum(name is not None for names in plan['runs'].values() for name in names)
+    print(f"  {len(plan['rules'])} CSS rules, {scripts} inline scripts")
+
+def main():
+    parser = argparse.ArgumentParser(description="Move inline CSS/JS that every page repeats into shared cacheable files")
+    parser.add_argument('pages', nargs='+', help="Pages to analyse together")
+    parser.add_argument('--output-dir', default='.', help=f"Where to write *{OUTPUT_SUFFIX} pages and {SHARED_DIR}/")
+    args = parser.parse_args()
+
+    pages = {}
+    for page in args.pages:
+        with open(page, 'r', encoding='utf-8') as f:
+            pages[page] = f.read()
+    plan = plan_hoisting(pages)
+    print_plan(plan, pages)
+    write_shared_files(plan, args.output_dir)
+    for page, html_content in pages.items():
+        output = os.path.join(args.output_dir, os.path.splitext(os.path.basename(page))[0] + OUTPUT_SUFFIX)
+        hoisted = rebase_page(hoist(html_content, plan), args.output_dir, (SHARED_DIR + '/',))
+        with open(output, 'w', encoding='utf-8') as f:
+            f.write(hoisted)
+        print(f"{page} -> {output}: {len(html_content.encode('utf-8'))} -> {len(hoisted.encode('utf-8'))} bytes")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Conservative pure-Python CSS and JavaScript minifiers used by the inliner.
+
+Both work on a token stream, so strings, template literals, regular
+expression literals and CSS calc() expressions pass through untouched; only
+comments and whitespace are removed. JavaScript line breaks are kept where
+automatic semicolon insertion could depend on them. If a file cannot be
+tokenized (e.g. an unterminated string) it is returned unchanged.
+
+    python3 minify_assets.py assets/asset_24.js assets/asset_62.css
+"""
+
+import argparse
+import re
+
+# CSS: whitespace on either side of these characters is never significant.
+# The + and - of calc() are deliberately absent, and so is a space before
+# ':' or '(' ("a :hover", "and (min-width...)").
+CSS_TIGHT = set('{};,>')
+CSS_TIGHT_AFTER = CSS_TIGHT | set(':(')
+CSS_TIGHT_BEFORE = CSS_TIGHT | set(')')
+# Comments starting /*! carry licences and are kept
+CSS_TOKEN_PATTERN = re.compile(
+    r'(?P<comment>/\*.*?\*/)'
+    r'|(?P<string>"(?:[^"\\\n]|\\.)*"|\'(?:[^\'\\\n]|\\.)*\')'
+    r'|(?P<unterminated>/\*|["\'])'
+    r'|(?P<space>\s+)'
+    r'|(?P<other>[^"\'/\s]+|/)',
+    re.DOTALL
+)
+
+# JavaScript: a '/' after one of these keywords starts a regular expression
+JS_REGEX_KEYWORDS = {
+    'return', 'typeof', 'instanceof', 'in', 'of', 'new', 'delete', 'void', 'throw',
+    'case', 'do', 'else', 'yield', 'await',
+}
+# A line break after one of these characters, or before one of the second
+# set, can never end a statement, so it is safe to drop
+JS_CONTINUES_AFTER = set('{([,;:=&|?!<>*%^~')
+JS_CONTINUES_BEFORE = set(')]},;.:?=&|')
+JS_IDENTIFIER_PATTERN = re.compile(r'[\w$\\\u0080-\uffff]+')
+JS_NUMBER_PATTERN = re.compile(r'\.?\d[\w.]*(?:[eE][+-]?\d+)?')
+JS_PUNCTUATOR_PATTERN = re.compile(r'>>>=?|\.\.\.|[=!]==|\*\*=?|&&=?|\|\|=?|\?\?=?|\?\.(?!\d)|'
+                                   r'<<=?|>>=?|=>|\+\+|--|[-+*/%&|^<>!=]=|[-+*/%&|^<>!=~?:;,.()[\]{}]')
+JS_HORIZONTAL_SPACE = ' \t\f\v\u00a0\ufeff'
+JS_LINE_TERMINATORS = '\r\n\u2028\u2029'
+
+class MinifyError(ValueError):
+    """The input could not be tokenized safely"""
+
+def is_word_char(char):
+    return char.isalnum() or char in '_$\\' or ord(char) > 127
+
+def minify_css(css):
+    """Strip comments and insignificant whitespace from a stylesheet"""
+    parts = []
+    pending_space = False
+    for match in CSS_TOKEN_PATTERN.finditer(css):
+        kind = match.lastgroup
+        token = match.group()
+        if kind == 'comment':
+            if token.startswith('/*!'):
+                parts.append(token)
+            else:
+                # A comment still separates tokens, e.g. "a/**/b"
+                pending_space = True
+            continue
+        if kind == 'space':
+            pending_space = True
+            continue
+        if kind == 'unterminated':
+            raise MinifyError(f"unterminated comment or string at offset {match.start()}")
+        if pending_space and parts:
+            previous = parts[-1][-1]
+            if previous not in CSS_TIGHT_AFTER and token[0] not in CSS_TIGHT_BEFORE:
+                parts.append(' ')
+        pending_space = False
+        if token.startswith('}') and parts and parts[-1] == ';':
+            parts.pop()
+        parts.append(token)
+    return ''.join(parts)
+
+def read_string(js, start):
+    """Return the end index of the quoted string starting at start"""
+    quote = js[start]
+    i = start + 1
+    while i < len(js):
+        char = js[i]
+        if char == '\\':
+            i += 2
+            continue
+        if char == quote:
+            return i + 1
+        if char == '\n':
+            break
+        i += 1
+    raise MinifyError(f"unterminated string at offset {start}")
+
+def read_regex(js, start):
+    """Return the end index (after flags) of the regular expression literal at start"""
+    i = start + 1
+    in_class = False
+    while i < len(js):
+        char = js[i]
+        if char == '\\':
+            i += 2
+            continue
+        if char == '\n':
+            break
+        if char == '[':
+            in_class = True
+        elif char == ']':
+            in_class = False
+        elif char == '/' and not in_class:
+            i += 1
+            while i < len(js) and is_word_char(js[i]):
+                i += 1
+            return i
+        i += 1
+    raise MinifyError(f"unterminated regular expression at offset {start}")
+
+def read_template(js, start):
+    """Return (end index, is complete) of template text starting at start.
+
+    Scanning stops after the closing backtick (complete) or after '${'
+    (an expression follows, and the template resumes at its closing '}').
+    """
+    i = start
+    while i < len(js):
+        char = js[i]
+        if char == '\\':
+            i += 2
+            continue
+        if char == '`':
+            return i + 1, True
+        if char == '$' and js.startswith('${', i):
+            return i + 2, False
+        i += 1
+    raise MinifyError(f"unterminated template literal at offset {start}")
+
+def minify_js(js):
+    """Strip comments and redundant whitespace from a script without renaming anything"""
+    parts = []
+    # Last significant token, used to tell a regex from a division
+    previous = ''
+    pending_space = pending_newline = False
+    # Brace depth at which each open template literal's ${ was entered
+    templates = []
+    depth = 0
+    i = 0
+    length = len(js)
+
+    def emit(token):
+        nonlocal pending_space, pending_newline
+        if parts:
+            last = parts[-1][-1]
+            first = token[0]
+            if pending_newline and last not in JS_CONTINUES_AFTER and first not in JS_CONTINUES_BEFORE:
+                parts.append('\n')
+            elif pending_space or pending_newline:
+                if (is_word_char(last) and is_word_char(first)) or (last in '+-' and first == last) \
+                        or (last == '/' and first in '/*') or (last == '.' and first.isdigit()) \
+                        or (parts[-1][0].isdigit() and first == '.'):
+                    parts.append(' ')
+        pending_space = pending_newline = False
+        parts.append(token)
+
+    while i < length:
+        char = js[i]
+        if char in JS_HORIZONTAL_SPACE:
+            pending_space = True
+            i += 1
+        elif char in JS_LINE_TERMINATORS:
+            pending_newline = True
+            i += 1
+        elif js.startswith('//', i):
+            end = js.find('\n', i)
+            i = length if end == -1 else end
+        elif js.startswith('/*', i):
+            end = js.find('*/', i + 2)
+            if end == -1:
+                raise MinifyError(f"unterminated comment at offset {i}")
+            comment = js[i:end + 2]
+            if comment.startswith('/*!'):
+                emit(comment)
+            elif '\n' in comment:
+                pending_newline = True
+            else:
+                pending_space = True
+            i = end + 2
+        elif char in '"\'':
+            end = read_string(js, i)
+            emit(js[i:end])
+            previous, i = js[i:end], end
+        elif char == '`' or (char == '}' and templates and templates[-1] == depth):
+            if char == '}':
+                # Back inside a template literal after a ${...} expression
+                templates.pop()
+            end, complete = read_template(js, i + 1)
+            if not complete:
+                templates.append(depth)
+            emit(js[i:end])
+            # An expression starts after '${', where '/' begins a regex
+            previous, i = '`' if complete else '{', end
+        elif char == '/' and (not previous or previous in JS_REGEX_KEYWORDS
+                              or (not is_word_char(previous[-1]) and previous[-1] not in ')]}`"\'')):
+            end = read_regex(js, i)
+            emit(js[i:end])
+            previous, i = js[i:end], end
+        else:
+            match = (JS_IDENTIFIER_PATTERN.match(js, i) if is_word_char(char) and not char.isdigit()
+                     else JS_NUMBER_PATTERN.match(js, i) if char.isdigit() or (char == '.' and js[i + 1:i + 2].isdigit())
+                     else JS_PUNCTUATOR_PATTERN.match(js, i))
+            if not match:
+                raise MinifyError(f"unexpected character {char!r} at offset {i}")
+            token = match.group()
+            if token == '{':
+                depth += 1
+            elif token == '}':
+                depth -= 1
+            emit(token)
+            previous, i = token, match.end()
+    return ''.join(parts)
+
+def minify(path, content):
+    """Minify content according to path's extension; unchanged if unsupported or untokenizable"""
+    try:
+        if path.endswith('.css'):
+            return minify_css(content)
+        if path.endswith('.js'):
+            return minify_js(content)
+    except MinifyError as e:
+        print(f"Warning: not minifying {path}: {e}")
+    return content
+
+def print_savings(savings):
+    """Report per-asset byte savings from (path, original bytes, minified bytes) tuples"""
+    if not savings:
+        return
+    print("Minification savings:")
+    for path, before, after in sorted(savings, key=lambda saving: saving[2] - saving[1]):
+        print(f"  {path}: {before} -> {after} bytes (-{before - after}, {100 * (before - after) / max(before, 1):.1f}%)")
+    before = sum(saving[1] for saving in savings)
+    after = sum(saving[2] for saving in savings)
+    print(f"  total: {before} -> {after} bytes (-{before - after})")
+
+def main():
+    parser = argparse.ArgumentParser(description="Report how much minification saves on asset files")
+    parser.add_argument('files', nargs='+', help="CSS or JS files")
+    args = parser.parse_args()
+    savings = []
+    for path in args.files:
+        with open(path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        savings.append((path, len(content.encode('utf-8')), len(minify(path, content).encode('utf-8'))))
+    print_savings(savings)
+
+if __name__ == "__main__":
+    main()
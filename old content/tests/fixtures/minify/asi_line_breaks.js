@@ -0,0 +1,16 @@
+// Line breaks that automatic semicolon insertion depends on are kept
+var a = 1
+var b = a
+++b
+function g() {
+  return
+    42
+}
+let c = b
+(function () {})
+i
+++
+j
+const d = x
+  ? y
+  : z
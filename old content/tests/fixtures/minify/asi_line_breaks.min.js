@@ -0,0 +1,11 @@
+var a=1
+var b=a
+++b
+function g(){return
+42}
+let c=b
+(function(){})
+i
+++
+j
+const d=x?y:z
\ No newline at end of file
@@ -0,0 +1,8 @@
+// A slash starts a regex after operators and keywords, division otherwise
+var r = /ab+c\/  d/gi;
+var half = width / 2 / scale;
+var s = str.replace(/ +/g, ' ');
+function f(x) {
+  return /[/*]+/.test(x);
+}
+var q = a / b / /c/.source.length;
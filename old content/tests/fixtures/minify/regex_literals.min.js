@@ -0,0 +1,2 @@
+var r=/ab+c\/  d/gi;var half=width/2/scale;var s=str.replace(/ +/g,' ');function f(x){return/[/*]+/.test(x);}
+var q=a/b/ /c/.source.length;
\ No newline at end of file
@@ -0,0 +1,5 @@
+// Quotes and escapes survive, comment markers inside strings too
+var a = "two  spaces /* not a comment */";
+var b = 'it\'s   // still a string';
+var c = "line\
+continued";
@@ -0,0 +1,2 @@
+var a="two  spaces /* not a comment */";var b='it\'s   // still a string';var c="line\
+continued";
\ No newline at end of file
@@ -0,0 +1,6 @@
+/* Template literals keep their whitespace, nested templates included */
+const name = 'x';
+const html = `<div class="a">
+    ${ name + `  inner  ${ 1 + 2 }  ` }   // kept
+</div>`;
+const tagged = tag`  a  ${ b }  `;
@@ -0,0 +1,3 @@
+const name='x';const html=`<div class="a">
+    ${name+`  inner  ${1+2}  `}   // kept
+</div>`;const tagged=tag`  a  ${b}  `;
\ No newline at end of file
@@ -0,0 +1,143 @@
+"""Inlining page assets"""
+
+import os
+import re
+
+from asset_inliner import AssetInliner, inline_file, read_file_content
+
+PAGE = '<html><head></head><body></body></html>'
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+def test_complete_mode_adds_legacy_asset_files(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write('mirror/asset_62.css', 'body{font-family:"DM Sans"}')
+    write('mirror/asset_24.js', 'trackPageView()')
+    inliner = AssetInliner('complete', read_file_content, assets_dir='mirror')
+    html = inliner.inline(PAGE)
+    assert 'font-family:"DM Sans"' in html
+    assert 'trackPageView' not in html
+
+def test_markup_inside_scripts_and_comments_is_left_alone(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write('assets/site.css', '.a{color:red}')
+    with open('a.png', 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+    script = ('<script>var s = \'<style>.b{color:blue}</style><img src="a.png">'
+              '<link rel="stylesheet" href="assets/site.css">\';</script>')
+    comment = '<!-- <img src="a.png"> -->'
+    page = f'<html><head><style>.gone{{color:red}}</style></head><body>{script}{comment}<img src="a.png"></body></html>'
+    inliner = AssetInliner('inline', read_file_content, purge=True, purge_pages=[], data_uris=True)
+    html = inliner.inline(page)
+    assert script in html and comment in html
+    assert '<img src="data:image/png;base64,' in html
+    assert ".gone" not in html
+
+def test_critical_css_urls_are_relative_to_the_page_in_fingerprint_mode(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write('assets/site.css', '.a{background:url(a.png);cursor:url(hand.cur),auto}')
+    with open('assets/a.png', 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+    page = '<html><head><link rel="stylesheet" href="assets/site.css"></head><body><div class="a">x</div></body></html>'
+    inliner = AssetInliner('fingerprint', read_file_content, critical=True)
+    html = inliner.inline(page, 'out')
+    [stylesheet] = [path for path in inliner.written if path.endswith('.css')]
+    assert 'url(../../assets/hand.cur)' in read_file_content(stylesheet)
+    [image] = [path for path in inliner.written if path.endswith('.png')]
+    assert f'url("static/{os.path.basename(image)}")' in html
+    assert 'url(../assets/hand.cur)' in html
+
+def test_cache_hit_still_compresses_fingerprinted_files(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write('assets/site.css', '.a{color:red}' * 100)
+    write('page.html', '<html><head><link rel="stylesheet" href="assets/site.css"></head><body></body></html>')
+    inline_file('page.html', 'out/page.html', 'fingerprint', compress=True, compress_workers=1)
+    [compressed] = [name for name in os.listdir('out/static') if name.endswith('.css.gz')]
+    os.remove(os.path.join('out/static', compressed))
+    inline_file('page.html', 'out/page.html', 'fingerprint', compress=True, compress_workers=1)
+    assert compressed in os.listdir('out/static')
+
+def flatten(tmp_path, monkeypatch, files):
+    monkeypatch.chdir(tmp_path)
+    for path, css in files.items():
+        write(path, css)
+    return AssetInliner('inline', read_file_content).flatten_css('css/main.css')
+
+def test_nested_imports_are_inlined_with_rebased_urls(tmp_path, monkeypatch):
+    imports, css, sources, complete = flatten(tmp_path, monkeypatch, {
+        'css/main.css': '@import "parts/base.css";.main{color:red}',
+        'css/parts/base.css': '@import url(deep/deep.css);.base{background:url(../img/a.png)}',
+        'css/parts/deep/deep.css': '.deep{margin:0}',
+    })
+    assert imports == [] and complete
+    assert css == '.deep{margin:0}.base{background:url(css/img/a.png)}.main{color:red}'
+    assert sources == {'css/main.css', 'css/parts/base.css', 'css/parts/deep/deep.css'}
+
+def test_import_cycles_are_dropped(tmp_path, monkeypatch):
+    imports, css, sources, complete = flatten(tmp_path, monkeypatch, {
+        'css/main.css': '@import "base.css";.main{color:red}',
+        'css/base.css': '@import "main.css";.base{color:blue}',
+    })
+    assert css == '.base{color:blue}.main{color:red}'
+    assert sources == {'css/main.css', 'css/base.css'}
+
+def test_media_qualified_imports_become_media_blocks(tmp_path, monkeypatch):
+    imports, css, sources, complete = flatten(tmp_path, monkeypatch, {
+        'css/main.css': '@import "print.css" print;.main{color:red}',
+        'css/print.css': '.main{color:black}',
+    })
+    assert css == '@media print{.main{color:black}}.main{color:red}'
+
+def test_remote_imports_stay_in_place(tmp_path, monkeypatch):
+    imports, css, sources, complete = flatten(tmp_path, monkeypatch, {
+        'css/main.css': '@import url("https://fonts.example.com/css?family=A");.main{color:red}',
+    })
+    assert imports == ['@import url("https://fonts.example.com/css?family=A");']
+    assert css == '.main{color:red}'
+    assert sources == {'css/main.css'}
+
+def test_critical_mode_inlines_above_the_fold_rules_and_defers_the_rest(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write('assets/site.css', '.hero{color:red}.footer{color:blue}')
+    page = ('<html><head><link rel="stylesheet" href="assets/site.css"></head><body>'
+            '<section class="hero">a</section><section>b</section><section class="footer">c</section>'
+            '</body></html>')
+    inliner = AssetInliner('inline', read_file_content, critical=True, fold_sections=1)
+    html = inliner.inline(page)
+    assert '.hero{color:red}' in html and '.footer' not in html
+    assert '<link rel="preload" href="assets/site.css" as="style"' in html
+    assert '<noscript><link rel="stylesheet" href="assets/site.css"></noscript>' in html
+    [(path, full, critical)] = inliner.render_blocking
+    assert path == 'assets/site.css' and critical < full
+
+def test_data_uris_embed_only_files_under_the_limit(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with open('small.png', 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+    with open('large.png', 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n' + bytes(100))
+    page = '<html><head></head><body><img src="small.png"><img src="large.png"></body></html>'
+    inliner = AssetInliner('inline', read_file_content, data_uris=True, data_uri_limit=50)
+    html = inliner.inline(page)
+    assert '<img src="data:image/png;base64,iVBORw0KGgo=">' in html
+    assert '<img src="large.png">' in html
+    embedded, external = inliner.page_data_uris()
+    assert [entry[0] for entry in embedded] == ['small.png']
+    assert external == [('large.png', 108)]
+
+def test_fingerprinted_copies_are_named_by_content(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write('assets/site.css', '.a{color:red}')
+    write('assets/copy.css', '.a{color:red}')
+    page = ('<html><head><link rel="stylesheet" href="assets/site.css">'
+            '<link rel="stylesheet" href="assets/copy.css"></head><body></body></html>')
+    inliner = AssetInliner('fingerprint', read_file_content)
+    html = inliner.inline(page, 'out')
+    [path] = inliner.written
+    name = os.path.basename(path)
+    assert re.fullmatch(r'site\.[0-9a-f]{8}\.css', name)
+    assert path == os.path.join('out', 'static', name)
+    assert html.count(f'href="static/{name}"') == 2
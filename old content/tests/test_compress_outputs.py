@@ -0,0 +1,29 @@
+"""Precompressed outputs and page-weight budgets"""
+
+import gzip
+
+from compress_outputs import PAGE_MARKUP, compress_files, page_weight, within_budget
+
+def test_compressible_files_get_a_reproducible_gz(tmp_path):
+    page = tmp_path / 'page.html'
+    page.write_text('<p>hello</p>' * 100, encoding='utf-8')
+    image = tmp_path / 'a.png'
+    image.write_bytes(b'\x89PNG\r\n\x1a\n')
+    [(path, raw, gzipped, brotli_size)] = compress_files([str(page), str(image), str(tmp_path / 'gone.css')], 1)
+    assert path == str(page) and raw == 1200
+    data = (tmp_path / 'page.html.gz').read_bytes()
+    assert len(data) == gzipped and gzip.decompress(data) == page.read_bytes()
+    compress_files([str(page)], 1)
+    assert (tmp_path / 'page.html.gz').read_bytes() == data
+    assert not (tmp_path / 'a.png.gz').exists()
+
+def test_page_weight_attributes_the_rest_to_markup():
+    script = 'console.log(1);' * 50
+    rows, total = page_weight(f'<html><script>{script}</script></html>', [('app.js', script)])
+    assert [row[0] for row in rows] == ['app.js', PAGE_MARKUP]
+    assert sum(row[2] for row in rows) == total
+
+def test_budget():
+    assert within_budget('page.html', 100, None)
+    assert within_budget('page.html', 100, 100)
+    assert not within_budget('page.html', 101, 100)
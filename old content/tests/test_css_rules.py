@@ -0,0 +1,26 @@
+"""Purging and cascade checks in css_rules"""
+
+from css_rules import Document, UsedNames, cascade_signature, order_matters, parse_stylesheet
+
+FONT_CSS = ('@font-face{font-family:"Open Sans";src:url(a.woff2)}'
+            '@font-face{font-family:"Unused Sans";src:url(b.woff2)}')
+
+def test_script_string_keeps_multi_word_font_family():
+    used = UsedNames()
+    used.add_document(Document('<div class="x"></div>'))
+    used.add_script("el.innerHTML = '<style>.p{font-family: \"Open Sans\", sans-serif}</style>';")
+    purged = used.purge(parse_stylesheet(FONT_CSS))
+    assert 'Open Sans' in purged
+    assert 'Unused Sans' not in purged
+
+def test_shorthand_orders_against_other_prefix_longhands():
+    font = cascade_signature(parse_stylesheet('.a{font:12px serif}')[0])
+    line_height = cascade_signature(parse_stylesheet('.a{line-height:2}')[0])
+    inset = cascade_signature(parse_stylesheet('.a{inset:0}')[0])
+    top = cascade_signature(parse_stylesheet('.a{top:1px}')[0])
+    color = cascade_signature(parse_stylesheet('.a{color:red}')[0])
+    reset = cascade_signature(parse_stylesheet('.a{all:unset}')[0])
+    assert order_matters(line_height, font)
+    assert order_matters(top, inset)
+    assert order_matters(color, reset)
+    assert not order_matters(color, font)
@@ -0,0 +1,129 @@
+"""Conditional requests against a local HTTP stand-in for the asset hosts"""
+
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from asset_manifest import AssetManifest
+from download_assets import ContentStore, HostPool, download_file, download_with_retry, plan_mirror
+from download_telemetry import RunTelemetry
+
+class AssetServer(ThreadingHTTPServer):
+    """Serves one body with an ETag, answering a matching If-None-Match with 304"""
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), AssetHandler)
+        self.body = b''
+        self.etag = None
+        self.requests = []
+
+    def serve(self, body, etag):
+        self.body = body
+        self.etag = etag
+
+class AssetHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests.append(dict(self.headers))
+        if self.headers.get('If-None-Match') == self.server.etag:
+            self.send_response(304)
+            self.send_header('ETag', self.server.etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', self.server.etag)
+        self.send_header('Content-Type', 'text/css')
+        self.send_header('Content-Length', str(len(self.server.body)))
+        self.end_headers()
+        self.wfile.write(self.server.body)
+
+    def do_HEAD(self):
+        if self.path != '/site.css':
+            # An error page whose length must not count as asset bytes
+            self.send_response(404)
+            self.send_header('Content-Length', '335')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(self.server.body)))
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    server = AssetServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture(params=[False, True], ids=['plain', 'store'])
+def fetch(request, server, tmp_path):
+    """Download the server's one URL into tmp_path, through a ContentStore for 'store'"""
+    url = f"http://127.0.0.1:{server.server_address[1]}/site.css"
+    local_path = str(tmp_path / 'assets' / 'site.css')
+    manifest = AssetManifest(str(tmp_path / 'manifest.json'))
+    store = ContentStore(str(tmp_path / 'assets' / '.store')) if request.param else None
+
+    def fetch():
+        return download_file(url, local_path, manifest=manifest, store=store)
+    fetch.url = url
+    fetch.local_path = local_path
+    fetch.manifest = manifest
+    return fetch
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+def test_200_then_304_keeps_file(server, fetch):
+    server.serve(b'AAAA', '"1"')
+    assert fetch() == 'downloaded'
+    assert fetch() == 'not-modified'
+    assert server.requests[-1].get('If-None-Match') == '"1"'
+    assert read(fetch.local_path) == b'AAAA'
+    assert fetch.manifest.get(fetch.url)['etag'] == '"1"'
+
+def test_changed_200_replaces_file(server, fetch):
+    # Same size, so only the hash tells the new body apart
+    server.serve(b'AAAA', '"1"')
+    assert fetch() == 'downloaded'
+    server.serve(b'BBBB', '"2"')
+    assert fetch() == 'downloaded'
+    assert read(fetch.local_path) == b'BBBB'
+    entry = fetch.manifest.get(fetch.url)
+    assert entry['etag'] == '"2"'
+    assert entry['size'] == 4
+    assert not os.path.exists(fetch.local_path + '.part')
+
+def test_same_200_is_unchanged(server, fetch):
+    server.serve(b'AAAA', '"1"')
+    assert fetch() == 'downloaded'
+    server.serve(b'AAAA', '"2"')
+    assert fetch() == 'unchanged'
+    assert read(fetch.local_path) == b'AAAA'
+    assert fetch.manifest.get(fetch.url)['etag'] == '"2"'
+
+def test_plan_ignores_error_page_sizes(server):
+    server.serve(b'AAAA', '"1"')
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    plan = plan_mirror([f"{base}/site.css", f"{base}/missing.css"], AssetManifest())
+    assert plan['total']['bytes'] == 4
+    assert plan['total']['transfer_bytes'] == 4
+    assert plan['total']['errors'] == 1
+    assert plan['total']['unknown_size'] == 0
+
+def test_telemetry_times_the_connection_each_request_opens(server, tmp_path):
+    server.serve(b'AAAA', '"1"')
+    url = f"http://127.0.0.1:{server.server_address[1]}/site.css"
+    telemetry = RunTelemetry()
+    status, retries, tripped = download_with_retry(url, str(tmp_path / 'site.css'), HostPool(), telemetry=telemetry)
+    assert status == 'downloaded'
+    [record] = telemetry.records
+    assert 0 < record['connect'] <= record['ttfb'] and 'tls' not in record
+    run = telemetry.report()['run']
+    assert run['connections'] == 1 and run['tls_p50'] is None
@@ -0,0 +1,34 @@
+"""Extracting external URLs from HTML in one streamed regex pass"""
+
+import io
+
+import pytest
+
+from download_assets import iter_references
+
+PAGE = '''<html><head>
+<link rel="stylesheet" href="https://cdn.example.com/site.css">
+<style>body{background:url("https://cdn.example.com/bg.png")}</style>
+<!-- <img src="https://img.example.com/commented.png"> -->
+<script src="https://js.example.com/app.js">var a = '<img src="https://img.example.com/in-script.png">';</script>
+</head><body>
+<img src=https://img.example.com/a.png srcset="https://img.example.com/a-1x.png 1x, https://img.example.com/a-2x.png 2x">
+<a href="https://www.example.com/?a=1&amp;b=2" style="background:url(https://cdn.example.com/link.svg)">x</a>
+<style>.late{background:url(https://cdn.example.com/unterminated.png)}
+'''
+
+@pytest.mark.parametrize('chunk_size', [3, 64, 64 * 1024])
+def test_references_skip_comments_and_scripts(chunk_size):
+    references = list(iter_references(io.StringIO(PAGE), chunk_size))
+    assert [(url, tag, attribute) for url, tag, attribute, context in references] == [
+        ('https://cdn.example.com/site.css', 'link', 'href'),
+        ('https://cdn.example.com/bg.png', 'style', 'url()'),
+        ('https://js.example.com/app.js', 'script', 'src'),
+        ('https://img.example.com/a.png', 'img', 'src'),
+        ('https://img.example.com/a-1x.png', 'img', 'srcset'),
+        ('https://img.example.com/a-2x.png', 'img', 'srcset'),
+        ('https://www.example.com/?a=1&b=2', 'a', 'href'),
+        ('https://cdn.example.com/link.svg', 'a', 'url()'),
+        ('https://cdn.example.com/unterminated.png', 'style', 'url()'),
+    ]
+    assert references[0][3] == {'rel': 'stylesheet', 'href': 'https://cdn.example.com/site.css'}
@@ -0,0 +1,51 @@
+"""Hoisting shared inline CSS and scripts"""
+
+from hoist_shared import hoist, plan_hoisting, shared_rules, write_shared_files
+
+def test_shorthand_is_not_hoisted_past_longhand():
+    pages = {
+        'a.html': '<style>.a{line-height:2}.b{color:red}.a{font:12px serif}</style>',
+        'b.html': '<style>.c{color:blue}.a{font:12px serif}</style>',
+    }
+    assert shared_rules(pages) == []
+
+def test_media_conditional_blocks_stay_inline():
+    block = '<style media="screen">.x{color:red}</style><style>.y{margin:0}</style>'
+    pages = {'a.html': block, 'b.html': block}
+    plan = plan_hoisting(pages)
+    assert plan['rules'] == ['.y{margin:0}']
+    assert '<style media="screen">.x{color:red}</style>' in hoist(block, plan)
+
+def test_each_shared_script_gets_its_own_file():
+    first = 'first();' * 200
+    second = 'second();' * 200
+    page = f'<script>{first}</script>\n<script>{second}</script>'
+    plan = plan_hoisting({'a.html': page, 'b.html': page})
+    [names] = plan['runs'].values()
+    assert [plan['files'][name] for name in names] == [first, second]
+    hoisted = hoist(page, plan)
+    assert all(f'<script src="{name}"></script>' in hoisted for name in names)
+
+def test_small_scripts_stay_inline():
+    large = 'setup();' * 200
+    page = f'<script>{large}</script>\n<script>tiny()</script>'
+    plan = plan_hoisting({'a.html': page, 'b.html': page})
+    [names] = plan['runs'].values()
+    assert names[1] is None and list(plan['files'].values()) == [large]
+    hoisted = hoist(page, plan)
+    assert f'<script src="{names[0]}"></script>\n<script>tiny()</script>' == hoisted
+
+def test_rules_are_not_hoisted_past_linked_stylesheets():
+    pages = {
+        'a.html': '<style>.a{margin:0}</style><link rel="stylesheet" href="x.css"><style>.b{color:red}</style>',
+        'b.html': '<style>.c{margin:1px}</style><link rel="stylesheet" href="x.css"><style>.b{color:red}</style>',
+    }
+    assert shared_rules(pages) == []
+
+def test_shared_css_urls_are_rebased(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    page = '<style>.a{background:url(assets/a.png)}</style>'
+    plan = plan_hoisting({'a.html': page, 'b.html': page})
+    [path] = write_shared_files(plan, 'out')
+    with open(path, 'r', encoding='utf-8') as f:
+        assert f.read() == '.a{background:url(../../assets/a.png)}'
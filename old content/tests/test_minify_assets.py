@@ -0,0 +1,32 @@
+"""Golden-file tests: each fixture name.js/.css must minify to name.min.js/.css"""
+
+import glob
+import os
+
+import pytest
+
+from minify_assets import minify
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'minify')
+INPUTS = sorted(path for path in glob.glob(os.path.join(FIXTURES, '*.*')) if '.min.' not in path)
+
+def read(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+def expected_path(path):
+    stem, extension = os.path.splitext(path)
+    return f"{stem}.min{extension}"
+
+@pytest.mark.parametrize('path', INPUTS, ids=os.path.basename)
+def test_matches_golden_output(path):
+    assert minify(path, read(path)) == read(expected_path(path))
+
+@pytest.mark.parametrize('path', INPUTS, ids=os.path.basename)
+def test_minified_output_is_stable(path):
+    expected = read(expected_path(path))
+    assert minify(path, expected) == expected
+
+def test_untokenizable_input_is_unchanged():
+    source = 'var s = "unterminated;\n'
+    assert minify('broken.js', source) == source
@@ -1,155 +1,228 @@
 #!/usr/bin/env python3
 import re
-import urllib.parse
-
-def create_local_path(url):
-    """Create a local file path for a URL"""
-    parsed = urllib.parse.urlparse(url)
-    
-    # Create a safe filename from the URL
-    path_parts = parsed.netloc.split('.')
-    if len(path_parts) > 2:
-        # For subdomains, use the main domain
-        domain = '.'.join(path_parts[-2:])
-    else:
-        domain = parsed.netloc
-    
-    # Get the path and filename
-    path = parsed.path
-    if not path or path == '/':
-        path = '/index.html'
-    
-    # Create local path
-    local_path = f"assets/{domain}{path}"
-    
-    # Ensure we have a filename
-    if not local_path.split('/')[-1]:
-        local_path = f"{local_path}index.html"
-    
-    return local_path
-
-def update_urls_in_html(html_content):
-    """Replace all external URLs with local paths"""
-    
-    def replace_url(match):
-        url = match.group(1)
-        parsed = urllib.parse.urlparse(url)
-        
-        # Create a safe filename from the URL
-        path_parts = parsed.netloc.split('.')
-        if len(path_parts) > 2:
-            # For subdomains, use the main domain
-            domain = '.'.join(path_parts[-2:])
-        else:
-            domain = parsed.netloc
-        
-        # Get the path and filename
-        path = parsed.path
-        if not path or path == '/':
-            path = '/index.html'
-        
-        # Create local path
-        local_path = f"assets/{domain}{path}"
-        
-        # Ensure we have a filename
-        if not local_path.split('/')[-1]:
-            local_path = f"{local_path}index.html"
-        
-        return f'href="{local_path}"'
-    
-    def replace_src(match):
-        url = match.group(1)
-        parsed = urllib.parse.urlparse(url)
-        
-        # Create a safe filename from the URL
-        path_parts = parsed.netloc.split('.')
-        if len(path_parts) > 2:
-            # For subdomains, use the main domain
-            domain = '.'.join(path_parts[-2:])
+
+from asset_manifest import create_local_path, load_manifest
+from build_cache import BuildCache
+
+# One pass over the document: comments are copied, <script> and <style>
+# bodies are handled as raw text and every other start tag has its
+# URL-bearing attributes rewritten.
+TOKEN_PATTERN = re.compile(
+    r'<!--.*?-->'
+    r'|<(script|style)\b([^>]*)>(.*?)</\1\s*>'
+    r'|<[a-zA-Z][\w:-]*(?:\s[^>]*)?>',
+    re.IGNORECASE | re.DOTALL
+)
+ATTRIBUTE_PATTERN = re.compile(r'(?<=\s)([\w:-]+)(\s*=\s*)(?:"([^"]*)"|\'([^\']*)\')')
+CSS_URL_PATTERN = re.compile(r'url\(\s*(["\']?)(https?://[^"\')\s]+)\1\s*\)', re.IGNORECASE)
+# Script bodies keep the old behaviour of rewriting attribute-like strings,
+# e.g. loader snippets that set s.src="https://..."
+SCRIPT_ATTRIBUTE_PATTERN = re.compile(r'(href|src|content)=(["\'])(https?://[^"\']+)\2', re.IGNORECASE)
+
+URL_ATTRIBUTES = {'href', 'src', 'content', 'data-src', 'poster'}
+SRCSET_ATTRIBUTES = {'srcset', 'data-srcset'}
+
+# Streaming: read this many characters at a time
+CHUNK_SIZE = 64 * 1024
+RAW_TEXT_TAG_PATTERN = re.compile(r'<(script|style)\b', re.IGNORECASE)
+COMMENT_END_PATTERN = re.compile(r'-->')
+# Characters re-searched at a chunk boundary when waiting for a closing tag
+CLOSE_OVERLAP = 16
+# A '<' that may begin a token; anything before it is plain text
+TOKEN_START_PATTERN = re.compile(r'<(?:[!a-zA-Z]|$)')
+
+def resolve_url(url, manifest=None):
+    """Return the local path for url, preferring what the downloader recorded"""
+    if manifest:
+        # Only point at files that were actually downloaded
+        return manifest.lookup(url) or url
+    return create_local_path(url)
+
+def is_external(url):
+    return url[:7].lower() == 'http://' or url[:8].lower() == 'https://'
+
+class UrlRewriter:
+    """Single-pass rewriter of external URLs with memoized resolution.
+
+    Handles href, src, content, data-src, poster, srcset/data-srcset,
+    url() in style attributes and <style> blocks, and attribute-like
+    strings inside <script> bodies.
+    """
+
+    def __init__(self, manifest=None):
+        self.manifest = manifest
+        self._resolved = {}
+
+    def resolve(self, url):
+        local_path = self._resolved.get(url)
+        if local_path is None:
+            local_path = self._resolved[url] = resolve_url(url, self.manifest)
+        return local_path
+
+    def rewrite_srcset(self, value):
+        candidates = []
+        for candidate in value.split(','):
+            parts = candidate.strip().split(None, 1)
+            if parts and is_external(parts[0]):
+                parts[0] = self.resolve(parts[0])
+            candidates.append(' '.join(parts))
+        return ', '.join(candidates)
+
+    def rewrite_css(self, css):
+        return CSS_URL_PATTERN.sub(
+            lambda m: f'url({m.group(1)}{self.resolve(m.group(2))}{m.group(1)})', css)
+
+    def rewrite_attribute(self, match):
+        name = match.group(1).lower()
+        quote = '"' if match.group(3) is not None else "'"
+        value = match.group(3) if match.group(3) is not None else match.group(4)
+        if name in URL_ATTRIBUTES and is_external(value):
+            value = self.resolve(value)
+        elif name in SRCSET_ATTRIBUTES and 'http' in value:
+            value = self.rewrite_srcset(value)
+        elif name == 'style' and 'url(' in value.lower():
+            value = self.rewrite_css(value)
         else:
-            domain = parsed.netloc
-        
-        # Get the path and filename
-        path = parsed.path
-        if not path or path == '/':
-            path = '/index.html'
-        
-        # Create local path
-        local_path = f"assets/{domain}{path}"
-        
-        # Ensure we have a filename
-        if not local_path.split('/')[-1]:
-            local_path = f"{local_path}index.html"
-        
-        return f'src="{local_path}"'
-    
-    def replace_content(match):
-        url = match.group(1)
-        parsed = urllib.parse.urlparse(url)
-        
-        # Create a safe filename from the URL
-        path_parts = parsed.netloc.split('.')
-        if len(path_parts) > 2:
-            # For subdomains, use the main domain
-            domain = '.'.join(path_parts[-2:])
+            return match.group(0)
+        return f'{match.group(1)}{match.group(2)}{quote}{value}{quote}'
+
+    def rewrite_tag(self, tag):
+        return ATTRIBUTE_PATTERN.sub(self.rewrite_attribute, tag)
+
+    def rewrite_script(self, body):
+        return SCRIPT_ATTRIBUTE_PATTERN.sub(
+            lambda m: f'{m.group(1)}={m.group(2)}{self.resolve(m.group(3))}{m.group(2)}', body)
+
+    def rewrite_token(self, match):
+        token = match.group(0)
+        if token.startswith('<!--'):
+            return token
+        raw_tag = match.group(1)
+        if raw_tag is None:
+            return self.rewrite_tag(token)
+        body = match.group(3)
+        body_start = match.start(3) - match.start(0)
+        open_tag = self.rewrite_tag(token[:body_start])
+        close_tag = token[body_start + len(body):]
+        if raw_tag.lower() == 'style':
+            body = self.rewrite_css(body)
         else:
-            domain = parsed.netloc
-        
-        # Get the path and filename
-        path = parsed.path
-        if not path or path == '/':
-            path = '/index.html'
-        
-        # Create local path
-        local_path = f"assets/{domain}{path}"
-        
-        # Ensure we have a filename
-        if not local_path.split('/')[-1]:
-            local_path = f"{local_path}index.html"
-        
-        return f'content="{local_path}"'
-    
-    updated_content = html_content
-    
-    # Replace href attributes
-    updated_content = re.sub(
-        r'href=["\'](https?://[^"\']+)["\']',
-        replace_url,
-        updated_content,
-        flags=re.IGNORECASE
-    )
-    
-    # Replace src attributes
-    updated_content = re.sub(
-        r'src=["\'](https?://[^"\']+)["\']',
-        replace_src,
-        updated_content,
-        flags=re.IGNORECASE
-    )
-    
-    # Replace content attributes
-    updated_content = re.sub(
-        r'content=["\'](https?://[^"\']+)["\']',
-        replace_content,
-        updated_content,
-        flags=re.IGNORECASE
-    )
-    
-    return updated_content
+            body = self.rewrite_script(body)
+        return f'{open_tag}{body}{close_tag}'
+
+    def rewrite(self, html_content):
+        """Rewrite a whole document in one linear scan"""
+        parts = []
+        position = 0
+        for match in TOKEN_PATTERN.finditer(html_content):
+            parts.append(html_content[position:match.start()])
+            parts.append(self.rewrite_token(match))
+            position = match.end()
+        parts.append(html_content[position:])
+        return ''.join(parts)
+
+    def rewrite_stream(self, source, target, chunk_size=CHUNK_SIZE):
+        """Rewrite from a text file object to another in chunks.
+
+        Output is identical to rewrite() on the whole document, while only the
+        current chunk plus any incomplete token (a tag, comment, or
+        <script>/<style> block) is held in memory.
+        """
+        for text, match in stream_tokens(source, chunk_size):
+            target.write(text)
+            if match:
+                target.write(self.rewrite_token(match))
+
+def pending_close(buffer, position, match):
+    """Return a pattern that must still arrive before match is final, or None.
+
+    A <script>/<style> open tag matched as a plain tag may still gain its
+    closing tag, and an unclosed <!-- skipped as text may still close.
+    """
+    if match.group(1) is None:
+        raw_tag = RAW_TEXT_TAG_PATTERN.match(match.group(0))
+        if raw_tag:
+            return re.compile(r'</%s\s*>' % raw_tag.group(1), re.IGNORECASE)
+    if buffer.find('<!--', position, match.start()) >= 0:
+        return COMMENT_END_PATTERN
+    return None
+
+def stream_tokens(source, chunk_size=CHUNK_SIZE):
+    """Yield (text, TOKEN_PATTERN match or None) in document order from a text file object read in chunks.
+
+    Together the pairs cover the whole document and tokenize it exactly as
+    TOKEN_PATTERN.finditer() would, while only the current chunk plus any
+    incomplete token is held in memory.
+    """
+    buffer = ''
+    waiting_for, search_from = None, 0
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        buffer += chunk
+        if waiting_for and not waiting_for.search(buffer, search_from):
+            # Still inside the same unfinished token; no need to rescan
+            search_from = max(0, len(buffer) - CLOSE_OVERLAP)
+            continue
+        waiting_for = None
+        position = 0
+        # Any <!-- that ends before the last --> is closed, so tokens up to
+        # there only need the raw-text check
+        comments_closed = buffer.rfind('-->')
+        for match in TOKEN_PATTERN.finditer(buffer):
+            start = match.start()
+            if start > comments_closed or (buffer[start + 1] in 'sS' and match.group(1) is None):
+                waiting_for = pending_close(buffer, position, match)
+                if waiting_for:
+                    break
+            yield buffer[position:start], match
+            position = match.end()
+        pending = TOKEN_START_PATTERN.search(buffer, position)
+        keep = pending.start() if pending else len(buffer)
+        yield buffer[position:keep], None
+        buffer = buffer[keep:]
+        search_from = max(0, len(buffer) - CLOSE_OVERLAP)
+    position = 0
+    for match in TOKEN_PATTERN.finditer(buffer):
+        yield buffer[position:match.start()], match
+        position = match.end()
+    yield buffer[position:], None
+
+def update_urls_in_html(html_content, manifest=None):
+    """Replace all external URLs with local paths"""
+    return UrlRewriter(manifest).rewrite(html_content)
+
+def update_urls_in_file(input_file, output_file, manifest=None, chunk_size=CHUNK_SIZE):
+    """Stream input_file through the rewriter into output_file"""
+    with open(input_file, 'r', encoding='utf-8', newline='') as source:
+        with open(output_file, 'w', encoding='utf-8', newline='') as target:
+            UrlRewriter(manifest).rewrite_stream(source, target, chunk_size)
 
 def main():
-    # Read the HTML file
-    with open('niw_full.html', 'r', encoding='utf-8') as f:
-        html_content = f.read()
-    
-    # Update URLs
-    updated_content = update_urls_in_html(html_content)
-    
-    # Write the updated HTML
-    with open('index.html', 'w', encoding='utf-8') as f:
-        f.write(updated_content)
-    
+    input_file = 'niw_full.html'
+    output_file = 'index.html'
+
+    # Resolve URLs against the downloader's manifest when there is one
+    manifest = load_manifest()
+    if not manifest:
+        print("No download manifest found; deriving local paths from URLs")
+
+    # Skip the rewrite when the page, the manifest and this script are unchanged
+    cache = BuildCache()
+    key = cache.key(__file__, {'output': output_file}, input_file, [manifest.path])
+    if cache.is_fresh(output_file, key):
+        print(f"{output_file} is up to date")
+        print(cache.summary())
+        return
+
+    # Stream the HTML file through the rewriter
+    update_urls_in_file(input_file, output_file, manifest)
+    cache.record(output_file, key, [manifest.path])
+    cache.save()
+
     print("Updated index.html with local asset paths")
+    print(cache.summary())
 
 if __name__ == "__main__":
     main()